@@ -0,0 +1,48 @@
+from constants import *
+
+# precomputed attack tables, indexed by square (y * RANK_COUNT + x) like Board.grid
+KNIGHT_OFFSETS = [(-2, 1), (-2, -1), (2, 1), (2, -1), (1, -2), (-1, -2), (1, 2), (-1, 2)]
+KING_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+ORTHOGONAL_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+DIAGONAL_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def in_bounds(x, y):
+    return -1 < x < RANK_COUNT and -1 < y < FILE_COUNT
+
+
+def leaper_table(offsets):
+    table = []
+    for y in range(FILE_COUNT):
+        for x in range(RANK_COUNT):
+            table.append([(y + dy) * RANK_COUNT + x + dx for dx, dy in offsets if in_bounds(x + dx, y + dy)])
+    return table
+
+
+def ray_table(directions):
+    table = []
+    for y in range(FILE_COUNT):
+        for x in range(RANK_COUNT):
+            rays = []
+            for dx, dy in directions:
+                # all the squares in a direction, ordered outward from the square
+                ray = []
+                i = 1
+                while in_bounds(x + dx * i, y + dy * i):
+                    ray.append((y + dy * i) * RANK_COUNT + x + dx * i)
+                    i += 1
+                if ray:
+                    rays.append(ray)
+            table.append(rays)
+    return table
+
+
+KNIGHT_ATTACKS = leaper_table(KNIGHT_OFFSETS)
+KING_ATTACKS = leaper_table(KING_OFFSETS)
+# the squares attacked by a pawn of each color standing on a square
+PAWN_ATTACKS = {
+    WHITE: leaper_table([(-1, 1), (1, 1)]),
+    BLACK: leaper_table([(-1, -1), (1, -1)])
+}
+ORTHOGONAL_RAYS = ray_table(ORTHOGONAL_DIRECTIONS)
+DIAGONAL_RAYS = ray_table(DIAGONAL_DIRECTIONS)
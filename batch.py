@@ -0,0 +1,202 @@
+"""
+validates archives of games in parallel: the games are read lazily, sent to a pool of
+worker processes in chunks, replayed move by move through Game.move, and the result
+of every game is reported as soon as its chunk is done
+
+usage: python batch.py FILE [FILE ...] [--workers N] [--chunk N] [--json]
+files ending in .pgn are read as PGN, any other file as game records of encoding.encode_game
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from constants import *
+from encoding import decode_game, read_games
+from game import Game
+from notation import parse_san
+from pgn import read_pgn
+
+CHUNK_SIZE = 64  # games sent to a worker at a time
+CHUNKS_PER_WORKER = 2  # chunks waiting per worker, which bounds the games held in memory
+PROGRESS_INTERVAL = 1.0  # seconds between progress reports
+
+
+def batch_game():
+    # a game that checks legality but has no clock, so replaying starts no timers
+    game = Game()
+    game.time_control = PRESET_TIME_CONTROLS['UNLIMITED']
+    # archived games often go on after a repetition or fifty moves nobody claimed
+    game.claim_draws = False
+    game.start_game(GAME_TYPES['P/P (Local)'])
+    return game
+
+
+def final_result(game):
+    # the result the moves themselves lead to: checkmate, stalemate or insufficient material
+    if game is None or game.started:
+        return '*'
+    if game.winner is None:
+        return '1/2-1/2'
+    return '1-0' if game.winner == WHITE else '0-1'
+
+
+def validate_pgn(pgn_game):
+    """
+    :param pgn_game: pgn.PgnGame
+    :return: (plies played, error or None, game)
+    """
+    game = batch_game()
+    if 'FEN' in pgn_game.headers:
+        try:
+            game.load_board(pgn_game.board(), *pgn_game.counters())
+        except ValueError as error:
+            return 0, f'invalid position: {error}', game
+    for ply, notation in enumerate(pgn_game.moves):
+        if not game.started:
+            return ply, f'move after the end of the game: {notation}', game
+        try:
+            start_pos, dest_pos, move_type, promotion = parse_san(game.board, notation)
+        except ValueError as error:
+            return ply, str(error), game
+        if not game.move(start_pos, dest_pos, promotion):
+            return ply, f'illegal move: {notation}', game
+    return len(pgn_game.moves), None, game
+
+
+def validate_record(record):
+    """
+    :param record: bytes of a game record made by encoding.encode_game
+    :return: (plies played, error or None, game)
+    """
+    game = batch_game()
+    ply = 0
+    try:
+        board, moves = decode_game(record)
+        game.load_board(board)
+        # the moves are decoded one at a time, so a bad one is only found when it is reached
+        for start_pos, dest_pos, move_type, promotion in moves:
+            if not game.started:
+                return ply, f'move after the end of the game at ply {ply}', game
+            # the kind of move recorded has to be the kind the move is in the position
+            if start_pos is None or game.validate_move(start_pos, dest_pos) != move_type or \
+                    not game.move(start_pos, dest_pos, promotion):
+                return ply, f'illegal move at ply {ply}', game
+            ply += 1
+    except ValueError as error:
+        return ply, f'invalid record at ply {ply}: {error}', game
+    return ply, None, game
+
+
+def validate_chunk(kind, first, items):
+    """
+    runs in a worker process
+    :param kind: 'PGN' or 'RECORD'
+    :param first: int index of the first game of the chunk
+    :param items: list of pgn.PgnGame or bytes
+    :return: list with a dict of results for each game
+    """
+    results = []
+    for i, item in enumerate(items):
+        start = time.perf_counter()
+        try:
+            plies, error, game = (validate_pgn if kind == 'PGN' else validate_record)(item)
+        except Exception as exception:
+            # a game the engine can not even set up is reported as invalid instead of stopping the batch
+            plies, error, game = 0, f'invalid game: {exception!r}', None
+        result = {'index': first + i, 'legal': error is None, 'plies': plies, 'result': final_result(game),
+                  'seconds': round(time.perf_counter() - start, 6)}
+        if error is not None:
+            result['error'] = error
+            result['illegal_ply'] = plies
+        if kind == 'PGN':
+            result['declared'] = item.result
+        results.append(result)
+    return results
+
+
+def read_items(paths):
+    """
+    :return: generator of (kind, game) for every game in the files, read lazily
+    """
+    for path in paths:
+        if path.lower().endswith('.pgn'):
+            with open(path, encoding='utf-8', errors='replace') as file:
+                for pgn_game in read_pgn(file):
+                    yield 'PGN', pgn_game
+        else:
+            with open(path, 'rb') as file:
+                for record in read_games(file):
+                    yield 'RECORD', record
+
+
+def chunks(items, size):
+    # group the games into chunks of one kind
+    kind, chunk = None, []
+    for item_kind, item in items:
+        if chunk and (item_kind != kind or len(chunk) == size):
+            yield kind, chunk
+            chunk = []
+        kind = item_kind
+        chunk.append(item)
+    if chunk:
+        yield kind, chunk
+
+
+def validate(paths, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    validate the games of the files in parallel
+    :param paths: list of file paths
+    :param workers: int number of processes, defaults to the number of cores
+    :param chunk_size: int games per chunk
+    :return: generator of result dicts (see validate_chunk), in the order their chunks finish
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = set()
+    first = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for kind, chunk in chunks(read_items(paths), chunk_size):
+            # wait for a chunk to finish before reading more games than the workers can take
+            while len(pending) >= workers * CHUNKS_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            pending.add(pool.submit(validate_chunk, kind, first, chunk))
+            first += len(chunk)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='validate games in parallel')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--workers', type=int, help='number of processes (default: number of cores)')
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help='games sent to a worker at a time')
+    parser.add_argument('--json', action='store_true', help='print the result of every game as a json line')
+    args = parser.parse_args(argv)
+
+    start = last_report = time.perf_counter()
+    games = illegal = plies = 0
+    for result in validate(args.files, args.workers, args.chunk):
+        games += 1
+        plies += result['plies']
+        if not result['legal']:
+            illegal += 1
+        if args.json:
+            print(json.dumps(result))
+        elif not result['legal']:
+            print(f'game {result["index"] + 1}: {result["error"]}')
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            print(f'{games} games, {games / (now - start):.0f} games/s, {illegal} illegal', file=sys.stderr)
+    seconds = time.perf_counter() - start
+    print(f'{games} games ({plies} plies) in {seconds:.2f}s, {illegal} illegal', file=sys.stderr)
+    return 1 if illegal else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
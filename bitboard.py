@@ -0,0 +1,478 @@
+from attacks import *
+from board import Board
+from constants import *
+from piece import *
+from square import SQUARES, Square
+from zobrist import CASTLE_RIGHTS
+
+# piece types in the order of their bitboards, 6 per color: bitboards[color * 6 + index]
+PIECE_TYPES = ['', 'N', 'B', 'R', 'Q', 'K']
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(len(PIECE_TYPES))
+SQUARE_COUNT = RANK_COUNT * FILE_COUNT
+
+
+def to_bitboard(squares):
+    bb = 0
+    for sqr in squares:
+        bb |= 1 << sqr
+    return bb
+
+
+def line_table(directions):
+    """
+    precompute the attacks of a slider along one line (two opposite directions)
+    for every square and every arrangement of blockers on that line
+    :param directions: the two opposite directions of the line
+    :return: (masks, attacks) where attacks[square][occupancy & masks[square]] is a bitboard
+    """
+    masks = []
+    attacks = []
+    for y in range(FILE_COUNT):
+        for x in range(RANK_COUNT):
+            rays = []
+            for dx, dy in directions:
+                ray = []
+                i = 1
+                while in_bounds(x + dx * i, y + dy * i):
+                    ray.append((y + dy * i) * RANK_COUNT + x + dx * i)
+                    i += 1
+                rays.append(ray)
+            # the last square of a ray never blocks anything behind it
+            mask = to_bitboard([sqr for ray in rays for sqr in ray[:-1]])
+            table = {}
+            # enumerate every subset of the mask
+            blockers = 0
+            while True:
+                attacked = 0
+                for ray in rays:
+                    for sqr in ray:
+                        attacked |= 1 << sqr
+                        if blockers & (1 << sqr):
+                            break
+                table[blockers] = attacked
+                blockers = (blockers - mask) & mask
+                if blockers == 0:
+                    break
+            masks.append(mask)
+            attacks.append(table)
+    return masks, attacks
+
+
+KNIGHT_MASKS = [to_bitboard(squares) for squares in KNIGHT_ATTACKS]
+KING_MASKS = [to_bitboard(squares) for squares in KING_ATTACKS]
+PAWN_MASKS = {color: [to_bitboard(squares) for squares in PAWN_ATTACKS[color]] for color in [BLACK, WHITE]}
+RANK_MASKS, RANK_LINE_ATTACKS = line_table([(-1, 0), (1, 0)])
+FILE_MASKS, FILE_LINE_ATTACKS = line_table([(0, -1), (0, 1)])
+DIAGONAL_MASKS, DIAGONAL_LINE_ATTACKS = line_table([(-1, -1), (1, 1)])
+ANTI_DIAGONAL_MASKS, ANTI_DIAGONAL_LINE_ATTACKS = line_table([(-1, 1), (1, -1)])
+DARK_SQUARES = to_bitboard(sqr for sqr in range(SQUARE_COUNT) if (sqr % RANK_COUNT + sqr // RANK_COUNT) % 2 == 0)
+
+
+def castle_table():
+    """
+    :return: dict mapping (color, castle type) to the squares that must be empty,
+             the squares the king passes that must not be attacked and the rook's square
+    """
+    table = {}
+    for color in [BLACK, WHITE]:
+        rank = 0 if color == WHITE else FILE_COUNT - 1
+        for castle_type in ['K', 'Q']:
+            passed = [sqr[1] * RANK_COUNT + sqr[0] for sqr in King.get_castle_squares(color, castle_type)]
+            between = range(5, 7) if castle_type == 'K' else range(1, 4)
+            rook_start = rank * RANK_COUNT + (RANK_COUNT - 1 if castle_type == 'K' else 0)
+            table[color, castle_type] = (to_bitboard(rank * RANK_COUNT + x for x in between), passed, rook_start)
+    return table
+
+
+CASTLE_SQUARES = castle_table()
+
+
+def rook_attacks(sqr, occupancy):
+    return (RANK_LINE_ATTACKS[sqr][occupancy & RANK_MASKS[sqr]] |
+            FILE_LINE_ATTACKS[sqr][occupancy & FILE_MASKS[sqr]])
+
+
+def bishop_attacks(sqr, occupancy):
+    return (DIAGONAL_LINE_ATTACKS[sqr][occupancy & DIAGONAL_MASKS[sqr]] |
+            ANTI_DIAGONAL_LINE_ATTACKS[sqr][occupancy & ANTI_DIAGONAL_MASKS[sqr]])
+
+
+def squares_of(bb):
+    # yield the index of every set bit, lowest first
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+class BitBoard:
+    """
+    a board stored as one 64-bit integer per piece type and color, with the same
+    interface as Board. the Piece objects it hands out are snapshots of a square,
+    they are not updated when the board changes
+    """
+    def __init__(self, setup=True):
+        self.index = -1
+        self.bitboards = [0] * (len(PIECE_TYPES) * 2)
+        self.occupied = [0, 0]  # the squares occupied by each color
+        self.moved = 0  # the squares holding a piece that has moved
+        self.en_passant = -1  # the square of the pawn that just jumped, if any
+        self.turn = WHITE  # the color to move
+        if setup:
+            self.setup_board()
+
+    def setup_board(self):
+        self.bitboards = [0] * (len(PIECE_TYPES) * 2)
+        self.occupied = [0, 0]
+        self.moved = 0
+        self.en_passant = -1
+        back_rank = ['R', 'N', 'B', 'Q', 'K', 'B', 'N', 'R']
+        for x in range(RANK_COUNT):
+            self.put(WHITE, '', 1 * RANK_COUNT + x)
+            self.put(BLACK, '', 6 * RANK_COUNT + x)
+            self.put(WHITE, back_rank[x], x)
+            self.put(BLACK, back_rank[x], 7 * RANK_COUNT + x)
+
+    def put(self, color, piece_type, sqr):
+        bit = 1 << sqr
+        self.bitboards[color * 6 + PIECE_TYPES.index(piece_type)] |= bit
+        self.occupied[color] |= bit
+
+    def type_at(self, sqr, color):
+        bit = 1 << sqr
+        bitboards = self.bitboards
+        for i in range(color * 6, color * 6 + 6):
+            if bitboards[i] & bit:
+                return i - color * 6
+        return -1
+
+    def castling_rights(self):
+        """
+        :return: int with a bit set for each of CASTLE_RIGHTS whose king and rook haven't moved
+        """
+        rights = 0
+        for i, (color, castle_type) in enumerate(CASTLE_RIGHTS):
+            offset = color * 6
+            king = (0 if color == WHITE else FILE_COUNT - 1) * RANK_COUNT + 4
+            rook_start = CASTLE_SQUARES[color, castle_type][2]
+            if self.bitboards[offset + KING] & (1 << king) and self.bitboards[offset + ROOK] & (1 << rook_start) \
+                    and not self.moved & ((1 << king) | (1 << rook_start)):
+                rights |= 1 << i
+        return rights
+
+    def color_at(self, sqr):
+        bit = 1 << sqr
+        if self.occupied[WHITE] & bit:
+            return WHITE
+        if self.occupied[BLACK] & bit:
+            return BLACK
+        return -1
+
+    def get_piece(self, x, y) -> Piece | None:
+        if not in_bounds(x, y):
+            return None
+        sqr = y * RANK_COUNT + x
+        color = self.color_at(sqr)
+        if color == -1:
+            return None
+        piece = PIECE_CLASSES[PIECE_TYPES[self.type_at(sqr, color)]](self, x, y, color)
+        piece.has_moved = bool(self.moved & (1 << sqr))
+        return piece
+
+    def get_square(self, x, y) -> Square | None:
+        if in_bounds(x, y):
+            return SQUARES[y * RANK_COUNT + x]
+        return None
+
+    def get_pieces_by_color(self, color) -> [Piece]:
+        return [self.get_piece(sqr % RANK_COUNT, sqr // RANK_COUNT) for sqr in squares_of(self.occupied[color])]
+
+    def get_king(self, color) -> King:
+        sqr = self.bitboards[color * 6 + KING].bit_length() - 1
+        return self.get_piece(sqr % RANK_COUNT, sqr // RANK_COUNT)
+
+    @property
+    def pieces(self):
+        return self.get_pieces_by_color(WHITE) + self.get_pieces_by_color(BLACK)
+
+    @property
+    def en_passant_pawn(self):
+        if self.en_passant == -1:
+            return None
+        return self.get_piece(self.en_passant % RANK_COUNT, self.en_passant // RANK_COUNT)
+
+    @en_passant_pawn.setter
+    def en_passant_pawn(self, pawn):
+        self.en_passant = -1 if pawn is None else pawn.pos[1] * RANK_COUNT + pawn.pos[0]
+
+    def capture(self, piece):
+        sqr = piece.pos[1] * RANK_COUNT + piece.pos[0]
+        bit = 1 << sqr
+        self.bitboards[piece.color * 6 + PIECE_TYPES.index(piece.piece_type)] &= ~bit
+        self.occupied[piece.color] &= ~bit
+        self.moved &= ~bit
+        piece.capture()
+
+    def make(self, start, dest, move_type, promotion='Q'):
+        """
+        make a move between two square indices in place
+        :return: the state before the move, to pass to unmake
+        """
+        record = (self.bitboards[:], self.occupied[:], self.moved, self.en_passant, self.turn)
+        bitboards = self.bitboards
+        occupied = self.occupied
+        start_bit = 1 << start
+        dest_bit = 1 << dest
+        color = WHITE if occupied[WHITE] & start_bit else BLACK
+        other = WHITE if color == BLACK else BLACK
+        # remove the captured piece
+        if move_type == MOVE_TYPES['EN_PASSANT']:
+            captured_bit = 1 << self.en_passant
+            bitboards[other * 6 + PAWN] ^= captured_bit
+            occupied[other] ^= captured_bit
+        elif occupied[other] & dest_bit:
+            for i in range(other * 6, other * 6 + 6):
+                if bitboards[i] & dest_bit:
+                    bitboards[i] ^= dest_bit
+                    break
+            occupied[other] ^= dest_bit
+        # move the piece
+        move_bits = start_bit | dest_bit
+        for i in range(color * 6, color * 6 + 6):
+            if bitboards[i] & start_bit:
+                bitboards[i] ^= move_bits
+                break
+        occupied[color] ^= move_bits
+        self.moved = (self.moved & ~start_bit) | dest_bit
+        if move_type == MOVE_TYPES['CASTLING']:
+            # move the rook to the square the king passed over
+            _, passed, rook_start = CASTLE_SQUARES[color, 'K' if dest > start else 'Q']
+            rook_bits = (1 << rook_start) | (1 << passed[0])
+            bitboards[color * 6 + ROOK] ^= rook_bits
+            occupied[color] ^= rook_bits
+            self.moved = (self.moved & ~(1 << rook_start)) | (1 << passed[0])
+        elif move_type == MOVE_TYPES['PROMOTION']:
+            bitboards[color * 6 + PAWN] ^= dest_bit
+            bitboards[color * 6 + PIECE_TYPES.index(promotion)] |= dest_bit
+        self.en_passant = dest if move_type == MOVE_TYPES['PAWN_JUMP'] else -1
+        self.turn = other
+        return record
+
+    def unmake(self, record):
+        self.bitboards, self.occupied, self.moved, self.en_passant, self.turn = record
+
+    def make_move(self, start_pos, dest_pos, move_type=MOVE_TYPES['NORMAL'], promotion='Q'):
+        return self.make(start_pos[1] * RANK_COUNT + start_pos[0], dest_pos[1] * RANK_COUNT + dest_pos[0],
+                         move_type, promotion)
+
+    def unmake_move(self, record):
+        self.unmake(record)
+
+    def move(self, start_pos, dest_pos, capture=False):
+        # a plain relocation, like Board.move, does not change the en passant pawn or the turn
+        en_passant = self.en_passant
+        turn = self.turn
+        self.make_move(start_pos, dest_pos)
+        self.en_passant = en_passant
+        self.turn = turn
+
+    def attacked(self, sqr, by_color):
+        bitboards = self.bitboards
+        offset = by_color * 6
+        if KNIGHT_MASKS[sqr] & bitboards[offset + KNIGHT]:
+            return True
+        if KING_MASKS[sqr] & bitboards[offset + KING]:
+            return True
+        if PAWN_MASKS[WHITE if by_color == BLACK else BLACK][sqr] & bitboards[offset + PAWN]:
+            return True
+        occupancy = self.occupied[WHITE] | self.occupied[BLACK]
+        queens = bitboards[offset + QUEEN]
+        if rook_attacks(sqr, occupancy) & (bitboards[offset + ROOK] | queens):
+            return True
+        return bool(bishop_attacks(sqr, occupancy) & (bitboards[offset + BISHOP] | queens))
+
+    def is_square_attacked(self, pos, by_color):
+        return self.attacked(pos[1] * RANK_COUNT + pos[0], by_color)
+
+    def king_attacked(self, color):
+        king = self.bitboards[color * 6 + KING]
+        return king != 0 and self.attacked(king.bit_length() - 1, WHITE if color == BLACK else BLACK)
+
+    def pseudo_legal_moves(self, color):
+        """
+        generate the moves of a color without checking if they leave the king in check
+        (castling is already checked for moving out of or through check)
+        :param color: int representing black or white
+        :return: list of (start, dest, move_type) square index tuples
+        """
+        moves = []
+        bitboards = self.bitboards
+        offset = color * 6
+        own = self.occupied[color]
+        other = WHITE if color == BLACK else BLACK
+        opponent = self.occupied[other]
+        occupancy = own | opponent
+        normal = MOVE_TYPES['NORMAL']
+        # pawns
+        step = RANK_COUNT if color == WHITE else -RANK_COUNT
+        home_rank = 1 if color == WHITE else FILE_COUNT - 2
+        last_rank = FILE_COUNT - 1 if color == WHITE else 0
+        pawn_captures = PAWN_MASKS[color]
+        for sqr in squares_of(bitboards[offset + PAWN]):
+            dest = sqr + step
+            # pawns moving onto the last rank promote
+            pawn_move = MOVE_TYPES['PROMOTION'] if dest // RANK_COUNT == last_rank else normal
+            if 0 <= dest < SQUARE_COUNT and not occupancy & (1 << dest):
+                moves.append((sqr, dest, pawn_move))
+                if sqr // RANK_COUNT == home_rank and not occupancy & (1 << (dest + step)):
+                    moves.append((sqr, dest + step, MOVE_TYPES['PAWN_JUMP']))
+            for dest in squares_of(pawn_captures[sqr] & opponent):
+                moves.append((sqr, dest, pawn_move))
+            en_passant = self.en_passant
+            if en_passant != -1 and opponent & (1 << en_passant) and en_passant // RANK_COUNT == sqr // RANK_COUNT \
+                    and abs(en_passant % RANK_COUNT - sqr % RANK_COUNT) == 1:
+                moves.append((sqr, en_passant + step, MOVE_TYPES['EN_PASSANT']))
+        # knights, bishops, rooks and queens
+        for sqr in squares_of(bitboards[offset + KNIGHT]):
+            for dest in squares_of(KNIGHT_MASKS[sqr] & ~own):
+                moves.append((sqr, dest, normal))
+        for sqr in squares_of(bitboards[offset + BISHOP]):
+            for dest in squares_of(bishop_attacks(sqr, occupancy) & ~own):
+                moves.append((sqr, dest, normal))
+        for sqr in squares_of(bitboards[offset + ROOK]):
+            for dest in squares_of(rook_attacks(sqr, occupancy) & ~own):
+                moves.append((sqr, dest, normal))
+        for sqr in squares_of(bitboards[offset + QUEEN]):
+            for dest in squares_of((rook_attacks(sqr, occupancy) | bishop_attacks(sqr, occupancy)) & ~own):
+                moves.append((sqr, dest, normal))
+        # the king, including castling
+        for sqr in squares_of(bitboards[offset + KING]):
+            for dest in squares_of(KING_MASKS[sqr] & ~own):
+                moves.append((sqr, dest, normal))
+            if self.moved & (1 << sqr) or sqr != (0 if color == WHITE else FILE_COUNT - 1) * RANK_COUNT + 4:
+                continue
+            for castle_type in ['K', 'Q']:
+                between, passed, rook_start = CASTLE_SQUARES[color, castle_type]
+                if occupancy & between or not bitboards[offset + ROOK] & (1 << rook_start) \
+                        or self.moved & (1 << rook_start):
+                    continue
+                if self.attacked(sqr, other) or any(self.attacked(s, other) for s in passed):
+                    continue
+                moves.append((sqr, passed[-1], MOVE_TYPES['CASTLING']))
+        return moves
+
+    def legal_move_list(self, color):
+        legal = []
+        for move in self.pseudo_legal_moves(color):
+            record = self.make(move[0], move[1], move[2])
+            if not self.king_attacked(color):
+                legal.append(move)
+            self.unmake(record)
+        return legal
+
+    def legal_moves(self, color):
+        """
+        the legal moves of a color, grouped by the square they start from
+        :param color: int representing black or white
+        :return: dict mapping start position to a dict of destination position to move type
+        """
+        return self.generate_legal_moves(color)
+
+    def generate_legal_moves(self, color):
+        moves = {}
+        for start, dest, move_type in self.legal_move_list(color):
+            start_pos = (start % RANK_COUNT, start // RANK_COUNT)
+            moves.setdefault(start_pos, {})[(dest % RANK_COUNT, dest // RANK_COUNT)] = move_type
+        return moves
+
+    def is_legal_move(self, start_pos, dest_pos, move_type=MOVE_TYPES['NORMAL']):
+        start = start_pos[1] * RANK_COUNT + start_pos[0]
+        dest = dest_pos[1] * RANK_COUNT + dest_pos[0]
+        color = self.color_at(start)
+        return (start, dest, move_type) in self.legal_move_list(color)
+
+    def is_checkmate(self, color):
+        return self.king_attacked(color) and not self.legal_move_list(color)
+
+    def is_stalemate(self, color):
+        return not self.king_attacked(color) and not self.legal_move_list(color)
+
+    def has_insufficient_material(self):
+        # see Board.has_insufficient_material
+        bitboards = self.bitboards
+        for offset in [WHITE * 6, BLACK * 6]:
+            if bitboards[offset + PAWN] | bitboards[offset + ROOK] | bitboards[offset + QUEEN]:
+                return False
+        knights = bitboards[WHITE * 6 + KNIGHT] | bitboards[BLACK * 6 + KNIGHT]
+        bishops = bitboards[WHITE * 6 + BISHOP] | bitboards[BLACK * 6 + BISHOP]
+        if (knights | bishops).bit_count() <= 1:
+            return True
+        return not knights and (not bishops & DARK_SQUARES or bishops & DARK_SQUARES == bishops)
+
+    def position_key(self, color):
+        """
+        a key that is the same for the same position with the same color to move, like Board.position_key,
+        the en passant pawn only counts if a pawn of color could take it
+        :param color: int representing black or white
+        :return: tuple
+        """
+        en_passant = -1
+        if self.en_passant != -1:
+            pawns = self.bitboards[color * 6 + PAWN]
+            rank = self.en_passant // RANK_COUNT
+            for sqr in [self.en_passant - 1, self.en_passant + 1]:
+                if sqr // RANK_COUNT == rank and pawns & (1 << sqr):
+                    en_passant = self.en_passant
+        return (*self.bitboards, color, self.castling_rights(), en_passant)
+
+    def copy(self):
+        board = BitBoard(setup=False)
+        board.bitboards = self.bitboards[:]
+        board.occupied = self.occupied[:]
+        board.moved = self.moved
+        board.en_passant = self.en_passant
+        board.turn = self.turn
+        return board
+
+    @staticmethod
+    def from_board(board):
+        bit_board = BitBoard(setup=False)
+        for piece in board.pieces:
+            sqr = piece.pos[1] * RANK_COUNT + piece.pos[0]
+            bit_board.put(piece.color, piece.piece_type, sqr)
+            if piece.has_moved:
+                bit_board.moved |= 1 << sqr
+        if board.en_passant_pawn is not None:
+            bit_board.en_passant_pawn = board.en_passant_pawn
+        bit_board.turn = board.turn
+        return bit_board
+
+    @staticmethod
+    def from_str(data):
+        return BitBoard.from_board(Board.from_str(data))
+
+    @staticmethod
+    def from_fen(fen):
+        return BitBoard.from_board(Board.from_fen(fen))
+
+    def to_fen(self, halfmove=0, fullmove=1):
+        # only uses the pieces, turn, castling rights and en passant pawn, which both boards have
+        return Board.to_fen(self, halfmove, fullmove)
+
+    def __str__(self):
+        rows = []
+        for y in range(FILE_COUNT):
+            row = []
+            for x in range(RANK_COUNT):
+                sqr = y * RANK_COUNT + x
+                color = self.color_at(sqr)
+                row.append('-' if color == -1 else ['b', 'w'][color] + PIECE_TYPES[self.type_at(sqr, color)])
+            rows.append('.'.join(row))
+        return '\n'.join(rows)
+
+
+# the board representations that can be used interchangeably
+BOARD_TYPES = {
+    'MAILBOX': Board,
+    'BITBOARD': BitBoard
+}
@@ -1,34 +1,69 @@
-import utils
+from attacks import *
+from cache import POSITION_CACHE, PositionInfo
 from constants import MOVE_TYPES
 from piece import *
-from square import Square
+from square import SQUARES, Square
+from zobrist import *
+
+
+class MoveRecord:
+    """
+    the undo information of a move made with Board.make_move
+    """
+    __slots__ = ('piece', 'start_pos', 'move_type', 'has_moved', 'captured', 'captured_pos', 'rook', 'rook_pos',
+                 'rook_has_moved', 'promoted', 'en_passant_pawn', 'version', 'turn', 'hash', 'castling',
+                 'en_passant_key')
+
+    def __init__(self, board, piece, move_type):
+        self.piece = piece  # the piece that was moved
+        self.start_pos = piece.pos
+        self.move_type = move_type
+        self.has_moved = piece.has_moved
+        self.captured = None  # the piece that was captured, if any
+        self.captured_pos = None
+        self.rook = None  # the rook that was moved when castling
+        self.rook_pos = None
+        self.rook_has_moved = False
+        self.promoted = None  # the piece a pawn promoted to
+        # the state of the board before the move
+        self.en_passant_pawn = board.en_passant_pawn
+        self.version = board.version
+        self.turn = board.turn
+        self.hash = board.hash
+        self.castling = board.castling
+        self.en_passant_key = board.en_passant_key
 
 
 class Board:
-    def __init__(self):
+    def __init__(self, setup=True):
         self.index = -1
-        self.squares = []
-        # initialize the squares
-        for y in range(FILE_COUNT):
-            for x in range(RANK_COUNT):
-                self.squares.append(Square(self, x, y))
-
-        self.pieces = []
-        self.setup_board()
+        # mailbox of the piece on each square, indexed by y * RANK_COUNT + x
+        self.grid = [None] * (FILE_COUNT * RANK_COUNT)
+        self.pieces = []  # all the pieces still on the board
+        self.pieces_by_color = {WHITE: [], BLACK: []}
+        self.kings = {WHITE: None, BLACK: None}
+        # every arrangement of the board gets a new version, cached moves are only valid for their version
+        self.version = 0
+        self.next_version = 1
+        self.moves_cache = {}
+        self.moves_cache_version = -1
         self.en_passant_pawn = None
+        self.turn = WHITE  # the color to move
+        # zobrist hash of the position, updated incrementally
+        self.hash = 0
+        self.castling = 0  # castling rights, one bit for each of CASTLE_RIGHTS
+        self.en_passant_key = 0  # the en passant part of the hash
+        if setup:
+            self.setup_board()
 
     def get_piece(self, x, y) -> Piece | None:
-        for piece in self.pieces:
-            if piece.pos == (x, y):
-                return piece
+        if -1 < x < RANK_COUNT and -1 < y < FILE_COUNT:
+            return self.grid[y * RANK_COUNT + x]
         return None
 
     def get_pieces_by_color(self, color) -> [Piece]:
-        pieces = []
-        for piece in self.pieces:
-            if piece.color == color:
-                pieces.append(piece)
-        return pieces
+        # the list is shared with the board, so callers must not modify it
+        return self.pieces_by_color[color]
 
     def get_pieces_by_type(self, piece_type):
         pieces = []
@@ -38,27 +73,116 @@ class Board:
         return pieces
 
     def get_square(self, x, y) -> Square | None:
-        for sqr in self.squares:
-            if sqr.pos == (x, y):
-                return sqr
+        if -1 < x < RANK_COUNT and -1 < y < FILE_COUNT:
+            return SQUARES[y * RANK_COUNT + x]
         return None
 
     def get_king(self, color) -> King:
-        for piece in self.pieces:
-            if piece.piece_type == 'K' and piece.color == color:
-                return piece
+        return self.kings[color]
+
+    def changed(self):
+        self.version = self.next_version
+        self.next_version += 1
+
+    def add_piece(self, piece):
+        """
+        place a piece on the board and register it in the lookup tables
+        :param piece: the piece to add, its position must be empty
+        :return: None
+        """
+        self.grid[piece.pos[1] * RANK_COUNT + piece.pos[0]] = piece
+        self.pieces.append(piece)
+        self.pieces_by_color[piece.color].append(piece)
+        if piece.piece_type == 'K':
+            self.kings[piece.color] = piece
+        self.hash ^= ZOBRIST_PIECES[piece.color, piece.piece_type][piece.pos[1] * RANK_COUNT + piece.pos[0]]
+        self.changed()
+
+    def capture(self, piece):
+        """
+        take a piece off of the board and mark it as captured
+        :param piece: the piece being captured
+        :return: None
+        """
+        self.remove_piece(piece)
+        piece.capture()
+
+    def remove_piece(self, piece):
+        """
+        take a piece off of the board and out of the lookup tables
+        :param piece: the piece to remove
+        :return: None
+        """
+        sqr = piece.pos[1] * RANK_COUNT + piece.pos[0]
+        self.grid[sqr] = None
+        self.hash ^= ZOBRIST_PIECES[piece.color, piece.piece_type][sqr]
+        self.pieces.remove(piece)
+        self.pieces_by_color[piece.color].remove(piece)
+        if self.kings[piece.color] is piece:
+            self.kings[piece.color] = None
+        self.changed()
+
+    def clear(self):
+        self.grid = [None] * (FILE_COUNT * RANK_COUNT)
+        self.pieces.clear()
+        self.pieces_by_color = {WHITE: [], BLACK: []}
+        self.kings = {WHITE: None, BLACK: None}
+        self.castling = 0
+        self.en_passant_key = 0
+        self.hash = ZOBRIST_TURN if self.turn == BLACK else 0
+        self.changed()
+
+    def castling_rights(self):
+        """
+        :return: int with a bit set for each of CASTLE_RIGHTS whose king and rook haven't moved
+        """
+        rights = 0
+        for i, (color, castle_type) in enumerate(CASTLE_RIGHTS):
+            y = 0 if color == WHITE else FILE_COUNT - 1
+            king = self.grid[y * RANK_COUNT + 4]
+            rook = self.grid[y * RANK_COUNT + (RANK_COUNT - 1 if castle_type == 'K' else 0)]
+            if king is not None and king.piece_type == 'K' and king.color == color and not king.has_moved and \
+                    rook is not None and rook.piece_type == 'R' and rook.color == color and not rook.has_moved:
+                rights |= 1 << i
+        return rights
+
+    def update_castling(self):
+        rights = self.castling_rights()
+        self.hash ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[rights]
+        self.castling = rights
+
+    def update_en_passant(self, pawn):
+        """
+        set the en passant pawn, hashing its file only if an enemy pawn could capture it
+        :param pawn: the pawn that just jumped, or None
+        :return: None
+        """
+        self.hash ^= self.en_passant_key
+        self.en_passant_pawn = pawn
+        self.en_passant_key = 0
+        if pawn is not None:
+            for x in [pawn.pos[0] - 1, pawn.pos[0] + 1]:
+                piece = self.get_piece(x, pawn.pos[1])
+                if piece is not None and piece.piece_type == '' and piece.color != pawn.color:
+                    self.en_passant_key = ZOBRIST_EN_PASSANT[pawn.pos[0]]
+        self.hash ^= self.en_passant_key
+
+    def set_turn(self, color):
+        if color != self.turn:
+            self.hash ^= ZOBRIST_TURN
+            self.turn = color
 
     # initialize all the pieces and squares
     def setup_board(self):
-        self.pieces.clear()
+        self.clear()
         # initialize the pieces
         for i in range(FILE_COUNT):
             # create the pawns
             wp = Pawn(self, i, 1, WHITE)
             bp = Pawn(self, i, 6, BLACK)
             # add the pawns
-            self.pieces.append(wp)
-            self.pieces.append(bp)
+            self.add_piece(wp)
+            self.add_piece(bp)
         # create the rooks
         wr1 = Rook(self, 0, 0, WHITE)
         wr2 = Rook(self, 7, 0, WHITE)
@@ -83,11 +207,12 @@ class Board:
         # add the rest of the pieces
         for p in [wr1, wr2, br1, br2, wn1, wn2, bn1,
                   bn2, wb1, wb2, bb1, bb2, wq, bq, wk, bk]:
-            self.pieces.append(p)
+            self.add_piece(p)
+        self.update_castling()
 
     def move(self, start_pos, dest_pos, capture=False):
         """
-        move a piece to the specified location and play a sound
+        move a piece to the specified location
         :param start_pos: list representing the starting location
         :param dest_pos: list representing the ending location
         :param capture: bool representing whether the move captures a piece or not
@@ -95,13 +220,120 @@ class Board:
         """
         piece1 = self.get_piece(start_pos[0], start_pos[1])
         piece2 = self.get_piece(dest_pos[0], dest_pos[1])
-        piece1.pos = tuple(dest_pos)
+        if piece2 is not None and piece2 is not piece1:
+            self.capture(piece2)
+        self.relocate(piece1, dest_pos)
         piece1.has_moved = True
-        if piece2 is not None:
-            piece2.capture()
-        # if this is not a copy, play the move sound
-        if self.index > -1:
-            utils.play_sound('CAPTURE' if capture else 'MOVE')
+        self.update_castling()
+
+    def relocate(self, piece, dest_pos):
+        start = piece.pos[1] * RANK_COUNT + piece.pos[0]
+        dest = dest_pos[1] * RANK_COUNT + dest_pos[0]
+        self.grid[start] = None
+        self.grid[dest] = piece
+        keys = ZOBRIST_PIECES[piece.color, piece.piece_type]
+        self.hash ^= keys[start] ^ keys[dest]
+        piece.pos = SQUARES[dest].pos
+        self.changed()
+
+    def make_move(self, start_pos, dest_pos, move_type=MOVE_TYPES['NORMAL'], promotion='Q') -> MoveRecord:
+        """
+        make a move in place without any side effects (no sounds, no copies)
+        :param start_pos: list representing the starting location
+        :param dest_pos: list representing the ending location
+        :param move_type: int representing the move type
+        :param promotion: str representing the piece type a pawn promotes to, or the piece type being dropped
+        :return: MoveRecord that can be passed to unmake_move
+        """
+        if move_type == MOVE_TYPES['DROP']:
+            return self.make_drop(dest_pos, promotion)
+        piece = self.get_piece(start_pos[0], start_pos[1])
+        record = MoveRecord(self, piece, move_type)
+        # find the captured piece, if any
+        if move_type == MOVE_TYPES['EN_PASSANT']:
+            captured = self.en_passant_pawn
+        else:
+            captured = self.get_piece(dest_pos[0], dest_pos[1])
+        if captured is not None and captured is not piece:
+            record.captured = captured
+            record.captured_pos = captured.pos
+            self.capture(captured)
+        self.relocate(piece, dest_pos)
+        piece.has_moved = True
+        if move_type == MOVE_TYPES['CASTLING']:
+            # move the rook to the first castle square
+            castle_type = 'Q' if dest_pos[0] == 2 else 'K'
+            castle_squares = King.get_castle_squares(piece.color, castle_type)
+            rook = self.get_piece(0 if castle_type == 'Q' else 7, dest_pos[1])
+            record.rook = rook
+            record.rook_pos = rook.pos
+            record.rook_has_moved = rook.has_moved
+            self.relocate(rook, castle_squares[0])
+            rook.has_moved = True
+        if move_type == MOVE_TYPES['PROMOTION']:
+            # replace the pawn with the piece it promotes to
+            self.remove_piece(piece)
+            promoted = PIECE_CLASSES[promotion](self, dest_pos[0], dest_pos[1], piece.color)
+            promoted.has_moved = True
+            self.add_piece(promoted)
+            record.promoted = promoted
+        # only a king or rook moving, or a rook being captured, changes the castling rights
+        if self.castling and (piece.piece_type in ('K', 'R') or (captured is not None and captured.piece_type == 'R')):
+            self.update_castling()
+        self.update_en_passant(piece if move_type == MOVE_TYPES['PAWN_JUMP'] else None)
+        self.set_turn(WHITE if piece.color == BLACK else BLACK)
+        return record
+
+    def make_drop(self, dest_pos, piece_type):
+        """
+        place a piece from the pocket of the color to move on an empty square (bughouse)
+        :param dest_pos: list representing the location to drop on
+        :param piece_type: str representing the type of the dropped piece
+        :return: MoveRecord that can be passed to unmake_move
+        """
+        color = self.turn
+        piece = PIECE_CLASSES[piece_type](self, dest_pos[0], dest_pos[1], color)
+        # a dropped pawn can still jump from its starting rank, a dropped rook can never castle
+        piece.has_moved = piece_type != '' or dest_pos[1] != (1 if color == WHITE else FILE_COUNT - 2)
+        record = MoveRecord(self, piece, MOVE_TYPES['DROP'])
+        self.add_piece(piece)
+        self.update_en_passant(None)
+        self.set_turn(WHITE if color == BLACK else BLACK)
+        return record
+
+    def unmake_move(self, record):
+        """
+        take back a move made with make_move, restoring the board exactly
+        :param record: MoveRecord returned by make_move
+        :return: None
+        """
+        if record.move_type == MOVE_TYPES['DROP']:
+            self.remove_piece(record.piece)
+        else:
+            self.unmake_pieces(record)
+        self.en_passant_pawn = record.en_passant_pawn
+        self.turn = record.turn
+        self.castling = record.castling
+        self.en_passant_key = record.en_passant_key
+        self.hash = record.hash
+        # the board is back to the same arrangement, so the cached moves are valid again
+        self.version = record.version
+
+    def unmake_pieces(self, record):
+        # put the pieces moved by record back
+        if record.rook is not None:
+            self.relocate(record.rook, record.rook_pos)
+            record.rook.has_moved = record.rook_has_moved
+        if record.promoted is not None:
+            # put the pawn back in place of the piece it promoted to
+            self.remove_piece(record.promoted)
+            self.add_piece(record.piece)
+        self.relocate(record.piece, record.start_pos)
+        record.piece.has_moved = record.has_moved
+        if record.captured is not None:
+            record.captured.pos = record.captured_pos
+            record.captured.captured = False
+            self.add_piece(record.captured)
 
     def is_valid_move(self, start_pos, dest_pos):
         """
@@ -131,11 +363,6 @@ class Board:
         :return: bool
         """
         piece1 = self.get_piece(start_pos[0], start_pos[1])
-        if move_type == MOVE_TYPES['NORMAL'] or move_type == MOVE_TYPES['PAWN_JUMP']:
-            # not legal if move allows own king to be in check
-            next_board = self.copy()
-            next_board.move(start_pos, dest_pos)
-            return not next_board.get_king(piece1.color).in_check()
         if move_type == MOVE_TYPES['CASTLING']:
             # can't castle in check
             if self.get_king(piece1.color).in_check():
@@ -143,14 +370,102 @@ class Board:
             # get the castle squares and castle type
             castle_type = 'Q' if dest_pos[0] == 2 else 'K'
             castle_squares = King.get_castle_squares(piece1.color, castle_type)
-            # move king through the castle squares
+            # king can't castle through check
+            opponent = WHITE if piece1.color == BLACK else BLACK
             for square in castle_squares:
-                next_board = self.copy()
-                next_board.move(start_pos, square)
-                # king can't castle through check
-                if next_board.get_king(piece1.color).in_check():
+                if self.is_square_attacked(square, opponent):
                     return False
-        return True
+            return True
+        # not legal if move allows own king to be in check
+        record = self.make_move(start_pos, dest_pos, move_type)
+        in_check = self.get_king(piece1.color).in_check()
+        self.unmake_move(record)
+        return not in_check
+
+    def is_square_attacked(self, pos, by_color):
+        """
+        checks if any piece of a color attacks a square, by looking outward from the square
+        :param pos: list representing the square's location
+        :param by_color: int representing the attacking color
+        :return: bool
+        """
+        grid = self.grid
+        target = pos[1] * RANK_COUNT + pos[0]
+        # knights, kings and pawns attack from fixed offsets
+        for i in KNIGHT_ATTACKS[target]:
+            piece = grid[i]
+            if piece is not None and piece.color == by_color and piece.piece_type == 'N':
+                return True
+        for i in KING_ATTACKS[target]:
+            piece = grid[i]
+            if piece is not None and piece.color == by_color and piece.piece_type == 'K':
+                return True
+        # a pawn attacks the target from where a pawn of the other color on the target would attack
+        for i in PAWN_ATTACKS[WHITE if by_color == BLACK else BLACK][target]:
+            piece = grid[i]
+            if piece is not None and piece.color == by_color and piece.piece_type == '':
+                return True
+        # sliding pieces attack along rays, up to the first piece in the way
+        for ray in ORTHOGONAL_RAYS[target]:
+            for i in ray:
+                piece = grid[i]
+                if piece is not None:
+                    if piece.color == by_color and (piece.piece_type == 'R' or piece.piece_type == 'Q'):
+                        return True
+                    break
+        for ray in DIAGONAL_RAYS[target]:
+            for i in ray:
+                piece = grid[i]
+                if piece is not None:
+                    if piece.color == by_color and (piece.piece_type == 'B' or piece.piece_type == 'Q'):
+                        return True
+                    break
+        return False
+
+    def position_key(self, color):
+        # the hash of this position with the given color to move
+        return self.hash if color == self.turn else self.hash ^ ZOBRIST_TURN
+
+    def position_info(self, color) -> PositionInfo:
+        """
+        the legal moves and check status of a color, calculated once per position
+        and shared through POSITION_CACHE with every board that reaches the same position
+        :param color: int representing black or white
+        :return: PositionInfo
+        """
+        if self.moves_cache_version != self.version:
+            self.moves_cache = {}
+            self.moves_cache_version = self.version
+        info = self.moves_cache.get(color)
+        if info is None:
+            key = self.position_key(color)
+            info = POSITION_CACHE.get(key)
+            if info is None:
+                info = PositionInfo(self.generate_legal_moves(color), self.get_king(color).in_check())
+                POSITION_CACHE.put(key, info)
+            self.moves_cache[color] = info
+        return info
+
+    def generate_legal_moves(self, color):
+        moves = {}
+        # promotions replace pieces in the list while they are checked, so loop over a copy
+        for piece in list(self.get_pieces_by_color(color)):
+            piece_moves = {}
+            for move in piece.get_possible_moves():
+                move_type = MOVE_TYPES['NORMAL'] if len(move) == 2 else MOVE_TYPES[move[2]]
+                if self.is_legal_move(piece.pos, move, move_type):
+                    piece_moves[(move[0], move[1])] = move_type
+            if piece_moves:
+                moves[piece.pos] = piece_moves
+        return moves
+
+    def legal_moves(self, color):
+        """
+        the legal moves of a color, calculated once per position
+        :param color: int representing black or white
+        :return: dict mapping start position to a dict of destination position to move type
+        """
+        return self.position_info(color).legal_moves
 
     def is_checkmate(self, color):
         """
@@ -158,20 +473,31 @@ class Board:
         :param color: int representing black or white
         :return: bool
         """
-        if not self.get_king(color).in_check():
-            return False
-        pieces = self.get_pieces_by_color(color)
-        for piece in pieces:
-            for move in piece.get_possible_moves():
-                move_type = MOVE_TYPES['NORMAL'] if len(move) == 2 else MOVE_TYPES[move[-1]]
-                if self.is_legal_move(piece.pos, move[0:2], move_type):
-                    return False
-        return True
+        return self.position_info(color).checkmate
+
+    def is_stalemate(self, color):
+        return self.position_info(color).stalemate
+
+    def has_insufficient_material(self):
+        """
+        checks if neither color can ever checkmate: only kings are left, with at most one knight or
+        bishop, or with bishops that all stand on squares of the same color
+        :return: bool
+        """
+        minors = []
+        for piece in self.pieces:
+            if piece.piece_type in ('', 'R', 'Q'):
+                return False
+            if piece.piece_type != 'K':
+                minors.append(piece)
+        if len(minors) <= 1:
+            return True
+        return all(piece.piece_type == 'B' for piece in minors) and \
+            len({(piece.pos[0] + piece.pos[1]) % 2 for piece in minors}) == 1
 
     @staticmethod
     def from_str(data):
-        board = Board()
-        board.pieces.clear()
+        board = Board(setup=False)
         lines = data.split('\n')
         for y in range(len(lines)):
             cols = lines[y].split('.')
@@ -184,41 +510,166 @@ class Board:
                             continue
                         case 'w':
                             p = Pawn(board, x, y, color)
-                            board.pieces.append(p)
+                            board.add_piece(p)
                         case 'b':
                             p = Pawn(board, x, y, color)
-                            board.pieces.append(p)
+                            board.add_piece(p)
                 else:
                     match code[1]:
                         case 'Q':
                             q = Queen(board, x, y, color)
-                            board.pieces.append(q)
+                            board.add_piece(q)
                         case 'K':
                             k = King(board, x, y, color)
-                            board.pieces.append(k)
+                            board.add_piece(k)
                         case 'N':
                             n = Knight(board, x, y, color)
-                            board.pieces.append(n)
+                            board.add_piece(n)
                         case 'B':
                             b = Bishop(board, x, y, color)
-                            board.pieces.append(b)
+                            board.add_piece(b)
                         case 'R':
                             r = Rook(board, x, y, color)
-                            board.pieces.append(r)
+                            board.add_piece(r)
+        board.mark_moved_pawns()
+        board.update_castling()
+        return board
+
+    def mark_moved_pawns(self):
+        # a pawn off of its starting rank has moved, so it can't jump
+        for piece in self.pieces:
+            if piece.piece_type == '' and piece.pos[1] != (1 if piece.color == WHITE else FILE_COUNT - 2):
+                piece.has_moved = True
+
+    def set_castling(self, rights):
+        """
+        mark the rooks and kings that lost their castling rights as moved
+        :param rights: int with a bit set for each of CASTLE_RIGHTS that is kept
+        :return: None
+        """
+        kept = set()  # the colors that can still castle to some side
+        for i, (color, castle_type) in enumerate(CASTLE_RIGHTS):
+            if rights & (1 << i):
+                kept.add(color)
+                continue
+            rook = self.get_piece(RANK_COUNT - 1 if castle_type == 'K' else 0, 0 if color == WHITE else FILE_COUNT - 1)
+            if rook is not None and rook.piece_type == 'R':
+                rook.has_moved = True
+        for color in [WHITE, BLACK]:
+            if color not in kept and self.get_king(color) is not None:
+                self.get_king(color).has_moved = True
+        self.update_castling()
+
+    @staticmethod
+    def from_fen(fen):
+        """
+        create a board from Forsyth-Edwards Notation
+        :param fen: str with the piece placement, side to move, castling rights and en passant square
+        :return: Board
+        :raises ValueError: if the FEN does not describe a position with one king of each color
+        """
+        fields = fen.split()
+        if not fields:
+            raise ValueError('empty FEN')
+        board = Board(setup=False)
+        rows = fields[0].split('/')
+        if len(rows) != FILE_COUNT:
+            raise ValueError(f'FEN has {len(rows)} ranks instead of {FILE_COUNT}: {fen}')
+        for i in range(len(rows)):
+            # the first row is the eighth rank
+            y = FILE_COUNT - 1 - i
+            x = 0
+            for code in rows[i]:
+                if code in '12345678':
+                    x += int(code)
+                    continue
+                piece_type = '' if code.upper() == 'P' else code.upper()
+                if piece_type not in PIECE_CLASSES:
+                    raise ValueError(f'not a piece in FEN: {code!r}')
+                if x >= RANK_COUNT:
+                    raise ValueError(f'rank {y + 1} of FEN has more than {RANK_COUNT} squares: {rows[i]}')
+                color = WHITE if code.isupper() else BLACK
+                board.add_piece(PIECE_CLASSES[piece_type](board, x, y, color))
+                x += 1
+            if x != RANK_COUNT:
+                raise ValueError(f'rank {y + 1} of FEN does not have {RANK_COUNT} squares: {rows[i]}')
+        for color in [WHITE, BLACK]:
+            kings = sum(1 for piece in board.pieces if piece.color == color and piece.piece_type == 'K')
+            if kings != 1:
+                raise ValueError(f'FEN has {kings} {"white" if color == WHITE else "black"} kings')
+        board.mark_moved_pawns()
+        letters = fields[2] if len(fields) > 2 else '-'
+        rights = 0
+        for i, (color, castle_type) in enumerate(CASTLE_RIGHTS):
+            if (castle_type if color == WHITE else castle_type.lower()) in letters:
+                rights |= 1 << i
+        board.set_castling(rights)
+        if len(fields) > 1 and fields[1] not in ('w', 'b'):
+            raise ValueError(f'side to move in FEN is not w or b: {fields[1]}')
+        board.set_turn(BLACK if len(fields) > 1 and fields[1] == 'b' else WHITE)
+        # the en passant square is the one behind the pawn that jumped
+        if len(fields) > 3 and fields[3] != '-':
+            square = fields[3]
+            if len(square) != 2 or square[0] not in FILES or square[1] not in '36':
+                raise ValueError(f'not an en passant square in FEN: {square}')
+            x = FILES.index(square[0])
+            y = int(square[1]) - 1
+            pawn = board.get_piece(x, y + 1 if y == 2 else y - 1)
+            if pawn is None or pawn.piece_type != '':
+                raise ValueError(f'no pawn in front of the en passant square in FEN: {square}')
+            board.update_en_passant(pawn)
         return board
 
+    def to_fen(self, halfmove=0, fullmove=1):
+        """
+        write the board in Forsyth-Edwards Notation, the inverse of from_fen
+        :param halfmove: int plies since the last capture or pawn move
+        :param fullmove: int number of the move being played
+        :return: str
+        """
+        names = {}
+        for piece in self.pieces:
+            code = piece.piece_type or 'P'
+            names[piece.pos] = code if piece.color == WHITE else code.lower()
+        rows = []
+        for y in range(FILE_COUNT - 1, -1, -1):
+            row = ''
+            empty = 0
+            for x in range(RANK_COUNT):
+                code = names.get((x, y))
+                if code is None:
+                    empty += 1
+                    continue
+                row += (str(empty) if empty else '') + code
+                empty = 0
+            rows.append(row + (str(empty) if empty else ''))
+        rights = self.castling_rights()
+        castling = ''.join(castle_type if color == WHITE else castle_type.lower()
+                           for i, (color, castle_type) in enumerate(CASTLE_RIGHTS) if rights & (1 << i))
+        # the en passant square is the one behind the pawn that jumped
+        en_passant = '-'
+        pawn = self.en_passant_pawn
+        if pawn is not None:
+            en_passant = FILES[pawn.pos[0]] + str(RANKS[pawn.pos[1] - 1 if pawn.color == WHITE else pawn.pos[1] + 1])
+        return f'{"/".join(rows)} {"w" if self.turn == WHITE else "b"} {castling or "-"} {en_passant} ' \
+               f'{halfmove} {fullmove}'
+
     def copy(self):
-        # create a new board
-        board = Board()
-        board.pieces.clear()
+        # create a new, empty board
+        board = Board(setup=False)
         # copy the pieces
         for piece in self.pieces:
-            board.pieces.append(piece.copy(board, type(piece)))
+            board.add_piece(piece.copy(board, type(piece)))
         # copy the en passant pawn if it exists
         if self.en_passant_pawn is not None:
             pawn_pos = self.en_passant_pawn.pos
             pawn = board.get_piece(pawn_pos[0], pawn_pos[1])
             board.en_passant_pawn = pawn
+        # the position is the same, so is its hash
+        board.turn = self.turn
+        board.castling = self.castling
+        board.en_passant_key = self.en_passant_key
+        board.hash = self.hash
         return board
 
     def __str__(self):
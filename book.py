@@ -0,0 +1,153 @@
+"""
+opening book: the moves played from each position of a collection of games, in a file
+sorted by the zobrist hash of the position
+
+the file is a header followed by fixed size entries, so the reader maps it into memory and
+binary-searches it in place, nothing is read until a position is looked up
+
+usage: python book.py PGN [PGN ...] --out BOOK [--plies N] [--min-games N]
+"""
+import argparse
+import mmap
+import random
+import struct
+import sys
+from collections import Counter
+from constants import *
+from encoding import decode_move, encode_move
+from pgn import read_pgn
+
+BOOK_MAGIC = b'BBBOOK\x00\x01'  # format version in the last byte
+ENTRY = struct.Struct('>QHH')  # position hash, encoded move, weight
+# big endian, so sorting the entries by their bytes sorts them by hash
+BOOK_PLIES = 24  # the plies of each game that go into the book
+MAX_WEIGHT = 0xFFFF
+
+
+def build_book(games, plies=BOOK_PLIES, min_games=1):
+    """
+    count the moves played from every position in the first plies of the games
+    :param games: iterable of pgn.PgnGame
+    :param plies: int plies of each game to count
+    :param min_games: int times a move has to be played to go into the book
+    :return: (sorted list of (hash, encoded move, weight), int games read)
+    """
+    counts = Counter()
+    count = 0
+    for pgn_game in games:
+        count += 1
+        try:
+            key = pgn_game.board().hash
+            for _, (board, move) in zip(range(plies), pgn_game.replay()):
+                counts[key, encode_move(*move)] += 1
+                key = board.hash
+        except ValueError:
+            continue  # the moves up to the illegal one are kept, a game with a bad FEN is skipped
+    entries = [(key, move, min(weight, MAX_WEIGHT)) for (key, move), weight in counts.items() if weight >= min_games]
+    entries.sort()
+    return entries, count
+
+
+def write_book(entries, file):
+    """
+    :param entries: sorted list of (hash, encoded move, weight)
+    :param file: a file open for writing bytes
+    :return: None
+    """
+    file.write(BOOK_MAGIC)
+    for entry in entries:
+        file.write(ENTRY.pack(*entry))
+
+
+class OpeningBook:
+    """
+    a book file mapped into memory, opening it reads only the header
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(BOOK_MAGIC)] != BOOK_MAGIC:
+            self.close()
+            raise ValueError(f'not an opening book: {path}')
+        self.size = (len(self.data) - len(BOOK_MAGIC)) // ENTRY.size  # the number of entries
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+            self.data = None
+
+    def key_at(self, i):
+        return ENTRY.unpack_from(self.data, len(BOOK_MAGIC) + i * ENTRY.size)[0]
+
+    def lookup(self, key):
+        """
+        :param key: int zobrist hash of a position
+        :return: list of ((start_pos, dest_pos, move_type, promotion), weight) of the moves played from it
+        """
+        # the first entry with the key, by binary search
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        for i in range(low, self.size):
+            entry_key, move, weight = ENTRY.unpack_from(self.data, len(BOOK_MAGIC) + i * ENTRY.size)
+            if entry_key != key:
+                break
+            moves.append((decode_move(move), weight))
+        return moves
+
+    def choose(self, board, rng=random):
+        """
+        pick a book move for the color to move, more often the more it was played
+        :param board: Board, whose hash is looked up
+        :param rng: random.Random or the random module
+        :return: (start_pos, dest_pos, promotion) or None if the position is not in the book
+        """
+        moves = []
+        weights = []
+        legal = board.legal_moves(board.turn)
+        for (start_pos, dest_pos, move_type, promotion), weight in self.lookup(board.hash):
+            # a different position can share the hash, so the move has to be legal here
+            if start_pos is not None and legal.get(start_pos, {}).get(dest_pos) == move_type and weight > 0:
+                moves.append((start_pos, dest_pos, promotion))
+                weights.append(weight)
+        if not moves:
+            return None
+        return rng.choices(moves, weights)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build an opening book from PGN files')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--out', required=True, help='the book file to write')
+    parser.add_argument('--plies', type=int, default=BOOK_PLIES, help='plies of each game that go into the book')
+    parser.add_argument('--min-games', type=int, default=1, help='times a move has to be played to go into the book')
+    args = parser.parse_args(argv)
+
+    def games():
+        for path in args.files:
+            with open(path, encoding='utf-8', errors='replace') as file:
+                yield from read_pgn(file)
+    entries, count = build_book(games(), args.plies, args.min_games)
+    with open(args.out, 'wb') as file:
+        write_book(entries, file)
+    print(f'{count} games, {len(entries)} book entries')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
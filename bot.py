@@ -0,0 +1,383 @@
+"""
+a computer opponent: a negamax alpha-beta search of a BitBoard with iterative deepening,
+move ordering and a quiescence search of captures, scored by material and piece-square tables
+
+the search runs in a worker process, so the game the bot plays in never waits on it
+
+usage: python bot.py [--fen FEN] [--time SECONDS] [--depth N]
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from bitboard import *
+from constants import *
+from encoding import decode_position, encode_position
+from notation import square_name
+from piece import MATERIAL_VALUES
+
+MATE_SCORE = 100000
+INFINITE = MATE_SCORE + 1
+MAX_DEPTH = 32
+TIME_CHECK_NODES = 1023  # the clock is read once every 1024 nodes
+MOVES_TO_GO = 30  # the number of moves the remaining time is shared between
+MIN_THINK_TIME = 0.1  # seconds
+UNLIMITED_THINK_TIME = 3.0  # seconds to think without a clock
+
+# piece-square tables in centipawns from white's side, written with the eighth rank first
+PIECE_SQUARE_TABLES = [
+    [0, 0, 0, 0, 0, 0, 0, 0,
+     50, 50, 50, 50, 50, 50, 50, 50,
+     10, 10, 20, 30, 30, 20, 10, 10,
+     5, 5, 10, 25, 25, 10, 5, 5,
+     0, 0, 0, 20, 20, 0, 0, 0,
+     5, -5, -10, 0, 0, -10, -5, 5,
+     5, 10, 10, -20, -20, 10, 10, 5,
+     0, 0, 0, 0, 0, 0, 0, 0],  # pawn
+    [-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20, 0, 0, 0, 0, -20, -40,
+     -30, 0, 10, 15, 15, 10, 0, -30,
+     -30, 5, 15, 20, 20, 15, 5, -30,
+     -30, 0, 15, 20, 20, 15, 0, -30,
+     -30, 5, 10, 15, 15, 10, 5, -30,
+     -40, -20, 0, 5, 5, 0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50],  # knight
+    [-20, -10, -10, -10, -10, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 10, 10, 5, 0, -10,
+     -10, 5, 5, 10, 10, 5, 5, -10,
+     -10, 0, 10, 10, 10, 10, 0, -10,
+     -10, 10, 10, 10, 10, 10, 10, -10,
+     -10, 5, 0, 0, 0, 0, 5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20],  # bishop
+    [0, 0, 0, 0, 0, 0, 0, 0,
+     5, 10, 10, 10, 10, 10, 10, 5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     0, 0, 0, 5, 5, 0, 0, 0],  # rook
+    [-20, -10, -10, -5, -5, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 5, 5, 5, 0, -10,
+     -5, 0, 5, 5, 5, 5, 0, -5,
+     0, 0, 5, 5, 5, 5, 0, -5,
+     -10, 5, 5, 5, 5, 5, 0, -10,
+     -10, 0, 5, 0, 0, 0, 0, -10,
+     -20, -10, -10, -5, -5, -10, -10, -20],  # queen
+    [-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+     20, 20, 0, 0, 0, 0, 20, 20,
+     20, 30, 10, 0, 0, 10, 30, 20]  # king
+]
+
+
+def square_values():
+    """
+    the value of a piece on each square, material included, indexed like BitBoard.bitboards
+    :return: list of 12 lists of 64 ints
+    """
+    values = [None] * (len(PIECE_TYPES) * 2)
+    for i, piece_type in enumerate(PIECE_TYPES):
+        # the king can't be captured, so only its square counts
+        material = 0 if piece_type == 'K' else MATERIAL_VALUES[piece_type] * 100
+        table = PIECE_SQUARE_TABLES[i]
+        values[WHITE * 6 + i] = [material + table[(FILE_COUNT - 1 - sqr // RANK_COUNT) * RANK_COUNT + sqr % RANK_COUNT]
+                                 for sqr in range(SQUARE_COUNT)]
+        # black's squares are white's mirrored across the middle of the board
+        values[BLACK * 6 + i] = [material + table[sqr] for sqr in range(SQUARE_COUNT)]
+    return values
+
+
+SQUARE_VALUES = square_values()
+
+
+def evaluate(board):
+    """
+    :param board: BitBoard
+    :return: int score in centipawns, from the side of the color to move
+    """
+    score = 0
+    bitboards = board.bitboards
+    for i in range(WHITE * 6, WHITE * 6 + 6):
+        values = SQUARE_VALUES[i]
+        for sqr in squares_of(bitboards[i]):
+            score += values[sqr]
+    for i in range(BLACK * 6, BLACK * 6 + 6):
+        values = SQUARE_VALUES[i]
+        for sqr in squares_of(bitboards[i]):
+            score -= values[sqr]
+    return score if board.turn == WHITE else -score
+
+
+def time_budget(clock, color):
+    """
+    the time to think about the next move, a share of the time left plus most of the increment
+    :param clock: clock.GameClock
+    :param color: int representing black or white
+    :return: float seconds
+    """
+    remaining = clock.time_left(color)
+    if remaining == float('inf'):
+        return UNLIMITED_THINK_TIME
+    budget = max(remaining / MOVES_TO_GO + clock.increment * 0.8, MIN_THINK_TIME)
+    return min(budget, remaining / 2)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Search:
+    """
+    an iterative deepening search of one position, which keeps the best move of the deepest
+    depth it finished when its time budget runs out
+    """
+    def __init__(self, board, time_budget, max_depth=MAX_DEPTH):
+        """
+        :param board: BitBoard, which is copied, the search leaves it unchanged
+        :param time_budget: float seconds to search for
+        :param max_depth: int plies to search at most
+        """
+        self.board = board.copy()
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.nodes = 0
+        self.deadline = float('inf')
+        self.killers = []  # for each ply, the last two quiet moves that caused a cutoff
+
+    def run(self, report=None):
+        """
+        search one ply deeper at a time until the time budget is spent
+        :param report: called with the info dict of every depth that finished
+        :return: (best (start, dest, move_type) square indices or None, list of info dicts with the
+                 depth, score, nodes, seconds, nodes per second and move of every finished depth)
+        """
+        started_at = time.perf_counter()
+        moves = self.ordered(self.board.legal_move_list(self.board.turn))
+        best = moves[0] if moves else None
+        infos = []
+        for depth in range(1, self.max_depth + 1):
+            if not moves:
+                break
+            # the first depth always finishes, so there is a move to play
+            self.deadline = float('inf') if depth == 1 else started_at + self.time_budget
+            self.killers = [[None, None] for _ in range(depth + 1)]
+            try:
+                score, best = self.root(moves, depth)
+            except SearchTimeout:
+                break
+            # the best move is searched first at the next depth
+            moves.remove(best)
+            moves.insert(0, best)
+            seconds = time.perf_counter() - started_at
+            info = {'depth': depth, 'score': score, 'nodes': self.nodes, 'seconds': round(seconds, 3),
+                    'nps': int(self.nodes / seconds) if seconds > 0 else 0, 'move': best}
+            infos.append(info)
+            if report is not None:
+                report(info)
+            if abs(score) > MATE_SCORE - MAX_DEPTH:
+                break  # a forced mate was found
+            if seconds > self.time_budget / 2:
+                break  # the next depth would not finish in time
+        return best, infos
+
+    def root(self, moves, depth):
+        board = self.board
+        alpha = -INFINITE
+        best = moves[0]
+        for move in moves:
+            record = board.make(move[0], move[1], move[2])
+            score = -self.negamax(depth - 1, -INFINITE, -alpha, 1)
+            board.unmake(record)
+            if score > alpha:
+                alpha, best = score, move
+        return alpha, best
+
+    def negamax(self, depth, alpha, beta, ply):
+        if depth <= 0:
+            return self.quiesce(alpha, beta)
+        self.tick()
+        board = self.board
+        color = board.turn
+        other = WHITE if color == BLACK else BLACK
+        killers = self.killers[ply]
+        legal = False
+        for move in self.ordered(board.pseudo_legal_moves(color), killers):
+            record = board.make(move[0], move[1], move[2])
+            if board.king_attacked(color):
+                board.unmake(record)
+                continue
+            legal = True
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.unmake(record)
+            if score >= beta:
+                # remember quiet moves that refute a position for its siblings
+                if not board.occupied[other] & (1 << move[1]) and move != killers[0]:
+                    killers[1] = killers[0]
+                    killers[0] = move
+                return beta
+            if score > alpha:
+                alpha = score
+        if not legal:
+            # mates closer to the root score higher
+            return -MATE_SCORE + ply if board.king_attacked(color) else 0
+        return alpha
+
+    def quiesce(self, alpha, beta):
+        # only captures and promotions are searched, so the score of a position isn't taken in the middle of a trade
+        self.tick()
+        board = self.board
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return beta
+        if stand_pat > alpha:
+            alpha = stand_pat
+        color = board.turn
+        opponent = board.occupied[WHITE if color == BLACK else BLACK]
+        captures = [move for move in board.pseudo_legal_moves(color) if opponent & (1 << move[1]) or
+                    move[2] in (MOVE_TYPES['EN_PASSANT'], MOVE_TYPES['PROMOTION'])]
+        for move in self.ordered(captures):
+            record = board.make(move[0], move[1], move[2])
+            if board.king_attacked(color):
+                board.unmake(record)
+                continue
+            score = -self.quiesce(-beta, -alpha)
+            board.unmake(record)
+            if score >= beta:
+                return beta
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def ordered(self, moves, killers=()):
+        """
+        sort moves so the likely best come first: promotions, then captures of the most valuable
+        piece by the least valuable one, then the killer moves and the other quiet moves
+        """
+        board = self.board
+        color = board.turn
+        other = WHITE if color == BLACK else BLACK
+        opponent = board.occupied[other]
+
+        def order(move):
+            start, dest, move_type = move
+            if move_type == MOVE_TYPES['PROMOTION']:
+                return 200
+            if move_type == MOVE_TYPES['EN_PASSANT']:
+                return 100
+            if opponent & (1 << dest):
+                return 100 + board.type_at(dest, other) * 10 - board.type_at(start, color)
+            return 50 if move in killers else 0
+        return sorted(moves, key=order, reverse=True)
+
+    def tick(self):
+        self.nodes += 1
+        if self.nodes & TIME_CHECK_NODES == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+
+def think(position, time_budget, max_depth=MAX_DEPTH):
+    """
+    search a position for its best move, runs in the bot's worker process
+    :param position: bytes of the position, see encoding.encode_position
+    :param time_budget: float seconds to search for
+    :param max_depth: int plies to search at most
+    :return: ((start_pos, dest_pos, promotion) or None if there is no legal move, list of info dicts, see Search.run)
+    """
+    board = decode_position(position, board_type='BITBOARD')
+    move, infos = Search(board, time_budget, max_depth).run()
+    if move is None:
+        return None, infos
+    start, dest, move_type = move
+    return ((start % RANK_COUNT, start // RANK_COUNT), (dest % RANK_COUNT, dest // RANK_COUNT), 'Q'), infos
+
+
+class Bot:
+    """
+    a computer player of one color, which thinks in a worker process while the game goes on
+    """
+    def __init__(self, color=BLACK, max_depth=MAX_DEPTH, book=None):
+        """
+        :param color: int representing black or white
+        :param max_depth: int plies to search at most
+        :param book: book.OpeningBook to play from before searching, if any
+        """
+        self.color = color
+        self.max_depth = max_depth
+        self.book = book
+        self.executor = None  # the worker process, started on the first move
+        self.future = None  # the move being thought about
+
+    def play(self, game, on_move):
+        """
+        start thinking about the position of game, if it is the bot's turn
+        :param game: Game
+        :param on_move: called with (start_pos, dest_pos, promotion) or None and the info dict of the
+                        deepest depth searched (see Search.run), from another thread unless it is a book move
+        :return: bool, whether the bot started thinking
+        """
+        if not game.started or game.turn != self.color or self.future is not None:
+            return False
+        if self.book is not None:
+            # a book move is played right away
+            move = self.book.choose(game.board)
+            if move is not None:
+                on_move(move, {'book': True})
+                return True
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1)
+        future = self.executor.submit(think, encode_position(game.board), time_budget(game.clock, self.color),
+                                      self.max_depth)
+        self.future = future
+        future.add_done_callback(lambda done: self.done(done, on_move))
+        return True
+
+    def done(self, future, on_move):
+        # a move that was cancelled in the meantime is dropped
+        if future is not self.future or future.cancelled():
+            return
+        self.future = None
+        move, infos = future.result()
+        on_move(move, infos[-1] if infos else {})
+
+    def cancel(self):
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
+
+    def close(self):
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='search a position and report the speed of the search')
+    parser.add_argument('--fen', help='the position to search (default: the starting position)')
+    parser.add_argument('--time', type=float, default=UNLIMITED_THINK_TIME, help='seconds to search for')
+    parser.add_argument('--depth', type=int, default=MAX_DEPTH, help='plies to search at most')
+    args = parser.parse_args(argv)
+    board = BitBoard.from_fen(args.fen) if args.fen else BitBoard()
+
+    def report(info):
+        start, dest, move_type = info['move']
+        print(f'depth {info["depth"]:2}  score {info["score"]:6}  nodes {info["nodes"]:9}  '
+              f'{info["nps"]:7} nodes/s  {info["seconds"]:7.3f}s  '
+              f'{square_name((start % RANK_COUNT, start // RANK_COUNT))}'
+              f'{square_name((dest % RANK_COUNT, dest // RANK_COUNT))}')
+    move, infos = Search(board, args.time, args.depth).run(report)
+    if move is None:
+        print('no legal moves')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
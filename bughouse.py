@@ -0,0 +1,197 @@
+from attacks import *
+from clock import thread_timer
+from constants import *
+from game import Game
+from notation import move_san
+
+POCKET_TYPES = ['', 'N', 'B', 'R', 'Q']  # the piece types that can be dropped
+
+
+def empty_pocket():
+    return {piece_type: 0 for piece_type in POCKET_TYPES}
+
+
+def check_blocks(board, color):
+    """
+    the squares a piece could be dropped on to block a check of the king of color
+    :param board: Board
+    :param color: int representing black or white
+    :return: set of square indices, empty if the check can't be blocked
+    """
+    grid = board.grid
+    king = board.get_king(color)
+    target = king.pos[1] * RANK_COUNT + king.pos[0]
+    by_color = WHITE if color == BLACK else BLACK
+    # a check from a knight or pawn can't be blocked
+    for i in KNIGHT_ATTACKS[target]:
+        piece = grid[i]
+        if piece is not None and piece.color == by_color and piece.piece_type == 'N':
+            return set()
+    for i in PAWN_ATTACKS[color][target]:
+        piece = grid[i]
+        if piece is not None and piece.color == by_color and piece.piece_type == '':
+            return set()
+    blocks = None
+    for rays, types in [(ORTHOGONAL_RAYS, ('R', 'Q')), (DIAGONAL_RAYS, ('B', 'Q'))]:
+        for ray in rays[target]:
+            for n, i in enumerate(ray):
+                piece = grid[i]
+                if piece is not None:
+                    if piece.color == by_color and piece.piece_type in types:
+                        # a double check can't be blocked
+                        if blocks is not None:
+                            return set()
+                        blocks = set(ray[:n])
+                    break
+    return blocks or set()
+
+
+class BughouseGame(Game):
+    """
+    one board of a bughouse match, whose players can also drop pieces from their pocket
+    drops are only supported by the mailbox board
+    """
+    def __init__(self, schedule=thread_timer):
+        super(BughouseGame, self).__init__('MAILBOX', schedule)
+        self.pockets = {WHITE: empty_pocket(), BLACK: empty_pocket()}
+        self.promoted = set()  # promoted pieces, which go back to the pocket as pawns
+        self.drops_cache = {}  # color to the squares it can drop on, for drops_version
+        self.drops_version = -1
+
+    def start_game(self, game_type):
+        self.pockets = {WHITE: empty_pocket(), BLACK: empty_pocket()}
+        self.promoted = set()
+        self.drops_cache = {}
+        self.drops_version = -1
+        super(BughouseGame, self).start_game(game_type)
+
+    def drop_squares(self, color):
+        """
+        the squares color could drop a piece on, calculated once per position
+        :param color: int representing black or white
+        :return: set of square indices
+        """
+        board = self.board
+        if self.drops_version != board.version:
+            self.drops_cache = {}
+            self.drops_version = board.version
+        squares = self.drops_cache.get(color)
+        if squares is None:
+            king = board.get_king(color)
+            if board.is_square_attacked(king.pos, WHITE if color == BLACK else BLACK):
+                # in check, a drop has to block it
+                squares = check_blocks(board, color)
+            else:
+                # dropping a piece can't put one's own king in check
+                squares = {i for i in range(RANK_COUNT * FILE_COUNT) if board.grid[i] is None}
+            self.drops_cache[color] = squares
+        return squares
+
+    def can_drop(self, color, piece_type, dest_pos):
+        """
+        checks if color has piece_type in its pocket and may drop it on dest_pos
+        :return: bool
+        """
+        if self.pockets[color].get(piece_type, 0) <= 0:
+            return False
+        # a flattened index would wrap around the edge of the board
+        if not (0 <= dest_pos[0] < RANK_COUNT and 0 <= dest_pos[1] < FILE_COUNT):
+            return False
+        # pawns can't be dropped on the first or last rank
+        if piece_type == '' and dest_pos[1] in (0, FILE_COUNT - 1):
+            return False
+        return dest_pos[1] * RANK_COUNT + dest_pos[0] in self.drop_squares(color)
+
+    def drop(self, piece_type, dest_pos):
+        """
+        drop a piece from the pocket of the player to move
+        :param piece_type: str representing the type of the piece
+        :param dest_pos: list representing the location to drop on
+        :return: bool, whether the drop was made
+        """
+        moved_at = self.clock.timer()
+        color = self.turn
+        # every check is made before the pocket, clock or board change
+        if not self.started or not self.can_drop(color, piece_type, dest_pos):
+            return False
+        if not self.clock.press(color, moved_at):
+            self.on_flag(color)
+            return False  # out of time
+        self.pockets[color][piece_type] -= 1
+        san = move_san(self.board, None, dest_pos, MOVE_TYPES['DROP'], piece_type)
+        self.board.make_move(None, dest_pos, MOVE_TYPES['DROP'], piece_type)
+        self.played(None, dest_pos, MOVE_TYPES['DROP'], piece_type, color, san=san)
+        return True
+
+    def played(self, start_pos, dest_pos, move_type, promotion, color, captured=None, captured_pos=None, san=''):
+        if move_type == MOVE_TYPES['PROMOTION']:
+            self.promoted.add(self.board.get_piece(dest_pos[0], dest_pos[1]))
+        super(BughouseGame, self).played(start_pos, dest_pos, move_type, promotion, color, captured, captured_pos,
+                                         san)
+
+    def is_checkmate(self, color):
+        # a check that a dropped piece could block isn't mate, the partner may still send one
+        return self.board.is_checkmate(color) and not self.drop_squares(color)
+
+    def drawn(self, key, material_changed):
+        # pieces can always arrive from the other board, so a bughouse board is never drawn by itself
+        return None
+
+    def pocket_type(self, piece):
+        # the type a captured piece goes to the pocket as
+        if piece in self.promoted:
+            self.promoted.discard(piece)
+            return ''
+        return piece.piece_type
+
+
+class BughouseMatch:
+    """
+    two boards played by two teams: white on the first board plays with black on the second,
+    pieces captured on one board go to the pocket of the capturer's partner on the other board
+    """
+    def __init__(self, time_control=PRESET_TIME_CONTROLS['BLITZ'], schedule=thread_timer):
+        self.games = [BughouseGame(schedule), BughouseGame(schedule)]
+        for i, game in enumerate(self.games):
+            game.time_control = time_control
+            game.events.subscribe('CAPTURE', lambda i=i, **kwargs: self.on_capture(i, **kwargs))
+            game.events.subscribe('END', lambda i=i, **kwargs: self.on_end(i, **kwargs))
+        self.started = False
+        self.winner = None  # the team that won, 0 or 1, None for a draw
+
+    def start(self, game_type=GAME_TYPES['P+P/P+P (Online)']):
+        self.started = True
+        self.winner = None
+        for game in self.games:
+            game.start_game(game_type)
+
+    @staticmethod
+    def team(board, color):
+        """
+        :param board: int index of the board
+        :param color: int representing black or white
+        :return: int team of the player of color on board
+        """
+        return 0 if (color == WHITE) == (board == 0) else 1
+
+    def on_capture(self, board, pos, color, piece):
+        # the captured piece keeps its color, the partner of the capturer plays that color on the other board
+        game = self.games[board]
+        self.games[1 - board].pockets[color][game.pocket_type(piece)] += 1
+
+    def on_end(self, board, winner):
+        # the match ends as soon as either board ends
+        if not self.started:
+            return
+        self.started = False
+        self.winner = None if winner is None else self.team(board, winner)
+        other = self.games[1 - board]
+        if other.started:
+            # the partner of the winner plays the other color on the other board
+            other.end_game(None if winner is None else WHITE if winner == BLACK else BLACK)
+
+    def time_left(self):
+        """
+        :return: list with a dict of color to seconds left for each board
+        """
+        return [{color: game.clock.time_left(color) for color in [WHITE, BLACK]} for game in self.games]
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+# rough memory used by a cached position, and by each of its legal moves
+ENTRY_SIZE = 400
+MOVE_SIZE = 150
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024  # bytes
+
+
+class PositionInfo:
+    """
+    the results calculated for a position with a side to move
+    """
+    __slots__ = ('legal_moves', 'in_check', 'checkmate', 'stalemate', 'size')
+
+    def __init__(self, legal_moves, in_check):
+        self.legal_moves = legal_moves  # dict of start position to dict of destination position to move type
+        self.in_check = in_check
+        self.checkmate = in_check and not legal_moves
+        self.stalemate = not in_check and not legal_moves
+        self.size = ENTRY_SIZE + MOVE_SIZE * sum(len(moves) for moves in legal_moves.values())
+
+
+class PositionCache:
+    """
+    a least recently used cache of PositionInfo keyed by zobrist hash,
+    evicting the oldest positions once the estimated size passes max_size bytes
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> PositionInfo | None:
+        info = self.entries.get(key)
+        if info is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return info
+
+    def put(self, key, info):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        self.entries[key] = info
+        self.size += info.size
+        self.shrink()
+
+    def resize(self, max_size):
+        self.max_size = max_size
+        self.shrink()
+
+    def shrink(self):
+        # evict the least recently used positions
+        while self.size > self.max_size and self.entries:
+            _, info = self.entries.popitem(last=False)
+            self.size -= info.size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# shared by every board in the process
+POSITION_CACHE = PositionCache()
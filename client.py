@@ -0,0 +1,81 @@
+import asyncio
+import json
+import threading
+from server import SERVER_HOST, SERVER_PORT, encode
+
+
+class GameClient:
+    """
+    a connection to a GameServer, calling on_message with every message the server sends
+    """
+    def __init__(self, on_message):
+        self.on_message = on_message
+        self.reader = None
+        self.writer = None
+        self.pending = []  # messages sent before the connection was made
+
+    async def connect(self, host=SERVER_HOST, port=SERVER_PORT):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        for message in self.pending:
+            self.send(message)
+        self.pending = []
+
+    def send(self, message):
+        if self.writer is None:
+            self.pending.append(message)
+        elif not self.writer.is_closing():
+            self.writer.write(encode(message))
+
+    async def listen(self):
+        # deliver the messages of the server until it disconnects
+        while True:
+            try:
+                line = await self.reader.readline()
+            except (ValueError, ConnectionError):
+                break
+            if not line:
+                break
+            self.on_message(json.loads(line))
+        self.on_message({'type': 'closed'})
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ClientThread:
+    """
+    runs a GameClient on an event loop of its own in a background thread, for a ui with its own main loop
+    on_message is called from the background thread, so the ui has to pass the message on to its own thread
+    """
+    def __init__(self, on_message, host=SERVER_HOST, port=SERVER_PORT):
+        self.on_message = on_message
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.client = GameClient(on_message)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.session())
+        self.loop.close()
+
+    async def session(self):
+        try:
+            await self.client.connect(self.host, self.port)
+        except OSError:
+            self.on_message({'type': 'error', 'message': f'could not connect to {self.host}:{self.port}'})
+            self.on_message({'type': 'closed'})
+            return
+        await self.client.listen()
+
+    def send(self, message):
+        # safe to call from any thread
+        self.loop.call_soon_threadsafe(self.client.send, message)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.client.close)
@@ -0,0 +1,114 @@
+import threading
+import time
+from constants import *
+
+
+def thread_timer(callback, delay):
+    """
+    call back once after a delay on a background thread, the default scheduler of GameClock
+    (kivy's Clock.schedule_once takes the same arguments, to call back on the ui thread instead)
+    :param callback: called with no arguments
+    :param delay: seconds to wait
+    :return: the timer, which can be cancelled
+    """
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+class GameClock:
+    """
+    the chess clock of a game, following a time control of [minutes, increment seconds]
+    the remaining time is calculated from a monotonic timer whenever it is asked for, and running
+    out of time is reported by a single scheduled callback, so the clock never has to be polled
+    """
+    def __init__(self, time_control, on_flag=None, schedule=thread_timer, timer=time.monotonic):
+        """
+        :param time_control: [minutes, increment seconds], e.g. PRESET_TIME_CONTROLS['BLITZ']
+        :param on_flag: called with the color whose time ran out
+        :param schedule: function(callback, delay) returning an object with a cancel method
+        :param timer: function returning the current time in seconds, it must never go backwards
+        """
+        self.increment = time_control[1]
+        self.remaining = {WHITE: time_control[0] * 60.0, BLACK: time_control[0] * 60.0}
+        self.on_flag = on_flag
+        self.schedule = schedule
+        self.timer = timer
+        self.running = None  # the color whose time is running
+        self.started_at = 0.0  # when the running clock was last started
+        self.flagged = None  # the color that ran out of time
+        self.alarm = None  # the scheduled callback for the running clock running out
+
+    def time_left(self, color, now=None):
+        """
+        :param color: int representing black or white
+        :param now: the time to measure at, from the clock's timer
+        :return: float seconds left, never below 0
+        """
+        remaining = self.remaining[color]
+        if color == self.running:
+            remaining -= (self.timer() if now is None else now) - self.started_at
+        return max(remaining, 0.0)
+
+    def start(self, color, now=None):
+        # run the clock of color
+        self.cancel_alarm()
+        self.running = color
+        self.started_at = self.timer() if now is None else now
+        if self.remaining[color] != float('inf'):
+            self.alarm = self.schedule(self.check_flag, self.remaining[color])
+
+    def press(self, color, now=None):
+        """
+        end the turn of color: stop its time, add the increment and start the opponent's time
+        :param color: int color that just moved
+        :param now: when the move was made, so time spent validating it is not charged to anyone
+        :return: False if color had already run out of time
+        """
+        now = self.timer() if now is None else now
+        if self.flagged is not None or self.time_left(color, now) <= 0:
+            return False
+        if self.running == color:
+            self.remaining[color] -= now - self.started_at
+        self.remaining[color] += self.increment
+        self.start(WHITE if color == BLACK else BLACK, now)
+        return True
+
+    def stop(self):
+        # stop the running clock, keeping the time left
+        if self.running is not None:
+            self.remaining[self.running] = self.time_left(self.running)
+            self.running = None
+        self.cancel_alarm()
+
+    def cancel_alarm(self):
+        if self.alarm is not None:
+            self.alarm.cancel()
+            self.alarm = None
+
+    def check_flag(self, *args):
+        # called back when the running clock should be out of time, the
+        # scheduler may be a bit early, so re-arm it for whatever is left
+        self.alarm = None
+        color = self.running
+        if color is None or self.flagged is not None:
+            return
+        left = self.time_left(color)
+        if left > 0:
+            self.alarm = self.schedule(self.check_flag, left)
+            return
+        self.stop()
+        self.flagged = color
+        if self.on_flag is not None:
+            self.on_flag(color)
+
+    @staticmethod
+    def format(seconds):
+        # m:ss, with tenths of a second once below ten seconds
+        if seconds == float('inf'):
+            return '-'
+        if seconds < 10:
+            return f'{seconds:.1f}'
+        minutes, seconds = divmod(int(seconds), 60)
+        return f'{minutes}:{seconds:02d}'
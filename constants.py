@@ -8,11 +8,13 @@ FILE_COUNT = 8
 
 GAME_TYPES = {
     'UNDEFINED': -1, 'P/P (Local)': 0, 'P/P (Online)': 1,
-    'P+P/P+P (Online)': 2, 'P+P/P+P (Party)': 3
+    'P+P/P+P (Online)': 2, 'P+P/P+P (Party)': 3,
+    'P/Bot (Local)': 4
 }
 MOVE_TYPES = {
     'ILLEGAL': -1, 'NORMAL': 0, 'PAWN_JUMP': 1,
-    'CASTLING': 2, 'EN_PASSANT': 3
+    'CASTLING': 2, 'EN_PASSANT': 3, 'PROMOTION': 4,
+    'DROP': 5
 }
 PRESET_TIME_CONTROLS = {
     'BULLET': [1, 1], 'BLITZ': [5, 3],
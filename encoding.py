@@ -0,0 +1,193 @@
+"""
+compact binary encoding of positions and moves, for network messages, storage and cache keys
+
+a position takes POSITION_SIZE bytes: a nibble for every square (two squares per byte, the
+lower nibble first), then a byte with the side to move and the castling rights, then the
+square of the pawn that can be taken en passant (NO_SQUARE if there is none)
+
+a move takes 16 bits: the destination square in bits 0-5, the starting square in bits 6-11
+and the kind of move (MOVE_FLAGS) in bits 12-15
+"""
+from bitboard import BOARD_TYPES
+from board import Board
+from constants import *
+from piece import PIECE_CLASSES
+
+SQUARE_COUNT = RANK_COUNT * FILE_COUNT
+POSITION_SIZE = SQUARE_COUNT // 2 + 2
+STATE_BYTE = SQUARE_COUNT // 2
+EN_PASSANT_BYTE = STATE_BYTE + 1
+NO_SQUARE = 0xFF
+# the nibble of each piece, 0 is an empty square and bit 3 marks a black piece
+NIBBLE_TYPES = ['', 'N', 'B', 'R', 'Q', 'K']
+PIECE_NIBBLES = {(color, piece_type): i + 1 + (0 if color == WHITE else 8)
+                 for color in [WHITE, BLACK] for i, piece_type in enumerate(NIBBLE_TYPES)}
+NIBBLE_PIECES = {nibble: piece for piece, nibble in PIECE_NIBBLES.items()}
+# the four bits of a move that say what kind of move it is
+MOVE_FLAGS = {
+    (MOVE_TYPES['NORMAL'], ''): 0, (MOVE_TYPES['PAWN_JUMP'], ''): 1,
+    (MOVE_TYPES['CASTLING'], ''): 2, (MOVE_TYPES['EN_PASSANT'], ''): 3,
+    (MOVE_TYPES['PROMOTION'], 'Q'): 4, (MOVE_TYPES['PROMOTION'], 'R'): 5,
+    (MOVE_TYPES['PROMOTION'], 'B'): 6, (MOVE_TYPES['PROMOTION'], 'N'): 7,
+    (MOVE_TYPES['DROP'], ''): 8, (MOVE_TYPES['DROP'], 'N'): 9, (MOVE_TYPES['DROP'], 'B'): 10,
+    (MOVE_TYPES['DROP'], 'R'): 11, (MOVE_TYPES['DROP'], 'Q'): 12
+}
+FLAG_MOVES = {flag: move for move, flag in MOVE_FLAGS.items()}
+
+
+def encode_position(board):
+    """
+    :param board: Board or BitBoard
+    :return: bytes of length POSITION_SIZE
+    """
+    data = bytearray(POSITION_SIZE)
+    for piece in board.pieces:
+        sqr = piece.pos[1] * RANK_COUNT + piece.pos[0]
+        data[sqr >> 1] |= PIECE_NIBBLES[piece.color, piece.piece_type] << ((sqr & 1) << 2)
+    data[STATE_BYTE] = board.turn | board.castling_rights() << 1
+    pawn = board.en_passant_pawn
+    data[EN_PASSANT_BYTE] = NO_SQUARE if pawn is None else pawn.pos[1] * RANK_COUNT + pawn.pos[0]
+    return bytes(data)
+
+
+def piece_at(data, sqr, offset=0):
+    """
+    read a single square straight from an encoded position, without decoding the rest
+    :param data: bytes, bytearray or memoryview holding the position
+    :param sqr: int square index, y * RANK_COUNT + x
+    :param offset: int where the position starts in data
+    :return: (color, piece type) or None if the square is empty
+    :raises ValueError: if the square holds a nibble of no piece
+    """
+    nibble = (data[offset + (sqr >> 1)] >> ((sqr & 1) << 2)) & 0xF
+    piece = NIBBLE_PIECES.get(nibble)
+    if piece is None and nibble:
+        raise ValueError(f'no piece has the nibble {nibble} (square {sqr})')
+    return piece
+
+
+def decode_position(data, offset=0, board_type='MAILBOX'):
+    """
+    build a board from an encoded position, reading data in place
+    :param data: bytes, bytearray or memoryview holding the position
+    :param offset: int where the position starts in data
+    :param board_type: str key of BOARD_TYPES
+    :return: Board or BitBoard
+    :raises ValueError: if a square holds a nibble of no piece, a color does not have one king,
+                        or the en passant square does not hold a pawn that just jumped
+    """
+    board = Board(setup=False)
+    for i in range(STATE_BYTE):
+        byte = data[offset + i]
+        if not byte:
+            continue
+        for sqr, nibble in [(i << 1, byte & 0xF), ((i << 1) + 1, byte >> 4)]:
+            if nibble:
+                if nibble not in NIBBLE_PIECES:
+                    raise ValueError(f'no piece has the nibble {nibble} (square {sqr})')
+                color, piece_type = NIBBLE_PIECES[nibble]
+                board.add_piece(PIECE_CLASSES[piece_type](board, sqr % RANK_COUNT, sqr // RANK_COUNT, color))
+    for color in [WHITE, BLACK]:
+        kings = sum(1 for piece in board.pieces if piece.color == color and piece.piece_type == 'K')
+        if kings != 1:
+            raise ValueError(f'position has {kings} {"white" if color == WHITE else "black"} kings')
+    board.mark_moved_pawns()
+    state = data[offset + STATE_BYTE]
+    board.set_castling(state >> 1)
+    board.set_turn(state & 1)
+    sqr = data[offset + EN_PASSANT_BYTE]
+    if sqr != NO_SQUARE:
+        # the pawn of the side that just moved, on the fourth or fifth rank it jumped to
+        pawn = board.get_piece(sqr % RANK_COUNT, sqr // RANK_COUNT)
+        if pawn is None or pawn.piece_type != '' or pawn.color == board.turn or \
+                pawn.pos[1] != (3 if pawn.color == WHITE else 4):
+            raise ValueError(f'no pawn that can be taken en passant on square {sqr}')
+        board.update_en_passant(pawn)
+    return board if board_type == 'MAILBOX' else BOARD_TYPES[board_type].from_board(board)
+
+
+def encode_move(start_pos, dest_pos, move_type=MOVE_TYPES['NORMAL'], promotion=''):
+    """
+    :param start_pos: list representing the starting location, None for a drop
+    :param dest_pos: list representing the ending location
+    :param move_type: int representing the move type
+    :param promotion: str piece type promoted to or dropped
+    :return: int that fits in 16 bits
+    """
+    if move_type not in (MOVE_TYPES['PROMOTION'], MOVE_TYPES['DROP']):
+        promotion = ''
+    start = 0 if start_pos is None else start_pos[1] * RANK_COUNT + start_pos[0]
+    return MOVE_FLAGS[move_type, promotion] << 12 | start << 6 | dest_pos[1] * RANK_COUNT + dest_pos[0]
+
+
+def decode_move(code):
+    """
+    :param code: int made by encode_move
+    :return: (start_pos, dest_pos, move_type, promotion), like the moves of Game.history
+    :raises ValueError: if the flag of the move is not one of MOVE_FLAGS
+    """
+    if code >> 12 not in FLAG_MOVES:
+        raise ValueError(f'no kind of move has the flag {code >> 12} (move {code:#06x})')
+    move_type, promotion = FLAG_MOVES[code >> 12]
+    start, dest = (code >> 6) & 0x3F, code & 0x3F
+    start_pos = None if move_type == MOVE_TYPES['DROP'] else (start % RANK_COUNT, start // RANK_COUNT)
+    if move_type != MOVE_TYPES['DROP']:
+        promotion = promotion or 'Q'  # the default of Board.make_move
+    return start_pos, (dest % RANK_COUNT, dest // RANK_COUNT), move_type, promotion
+
+
+def encode_moves(moves):
+    """
+    :param moves: iterable of (start_pos, dest_pos, move_type, promotion)
+    :return: bytes with two (little endian) bytes per move
+    """
+    data = bytearray()
+    for move in moves:
+        code = encode_move(*move)
+        data.append(code & 0xFF)
+        data.append(code >> 8)
+    return bytes(data)
+
+
+def decode_moves(data):
+    """
+    decode the moves of encode_moves lazily, straight from the buffer
+    :param data: bytes, bytearray or memoryview
+    :return: generator of (start_pos, dest_pos, move_type, promotion)
+    """
+    view = memoryview(data)
+    for i in range(0, len(view) - 1, 2):
+        yield decode_move(view[i] | view[i + 1] << 8)
+
+
+def encode_game(board, moves):
+    """
+    a game record: the starting position, the number of moves (two bytes, little endian) and the moves
+    :param board: the starting position
+    :param moves: list of (start_pos, dest_pos, move_type, promotion)
+    :return: bytes
+    """
+    return encode_position(board) + bytes([len(moves) & 0xFF, len(moves) >> 8]) + encode_moves(moves)
+
+
+def read_games(file):
+    """
+    read the game records of encode_game written one after the other, one at a time
+    :param file: a file opened in binary mode
+    :return: generator of bytes, each holding one record to decode with decode_game
+    """
+    while True:
+        head = file.read(POSITION_SIZE + 2)
+        if len(head) < POSITION_SIZE + 2:
+            return
+        count = head[POSITION_SIZE] | head[POSITION_SIZE + 1] << 8
+        yield head + file.read(count * 2)
+
+
+def decode_game(data, board_type='MAILBOX'):
+    """
+    :param data: bytes or memoryview holding a record made by encode_game
+    :return: (starting board, generator of moves)
+    """
+    view = memoryview(data)
+    return decode_position(view, 0, board_type), decode_moves(view[POSITION_SIZE + 2:])
@@ -0,0 +1,23 @@
+class EventBus:
+    """
+    delivers game events to whoever subscribed to them, so the rules engine
+    never has to know about sounds, rendering or the network
+    """
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, event, callback):
+        """
+        :param event: str name of the event, e.g. 'MOVE'
+        :param callback: called with the keyword arguments of every emit of the event
+        :return: None
+        """
+        self.subscribers.setdefault(event, []).append(callback)
+
+    def unsubscribe(self, event, callback):
+        if callback in self.subscribers.get(event, []):
+            self.subscribers[event].remove(callback)
+
+    def emit(self, event, **kwargs):
+        for callback in self.subscribers.get(event, []):
+            callback(**kwargs)
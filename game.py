@@ -1,83 +1,227 @@
-import time
+from collections import Counter, OrderedDict
+from bitboard import BOARD_TYPES
 from board import *
+from clock import GameClock, thread_timer
 from constants import *
+from events import EventBus
+from notation import move_san
+
+KEYFRAME_INTERVAL = 16  # plies between stored copies of the board
+VIEW_CACHE_SIZE = 8  # rebuilt past boards kept around for stepping back and forth
+REPETITION_LIMIT = 3  # the times a position has to occur for the game to be drawn
+FIFTY_MOVE_PLIES = 100  # plies without a capture or pawn move for the game to be drawn
+DRAW_REASONS = ['STALEMATE', 'INSUFFICIENT_MATERIAL', 'REPETITION', 'FIFTY_MOVES']
 
 
 class Game:
-    def __init__(self):
-        self.board = Board()  # the current board state of the game
+    def __init__(self, board_type='MAILBOX', schedule=thread_timer):
+        self.board_type = BOARD_TYPES[board_type]  # the board representation to play on
+        self.board = self.board_type()  # the current board state of the game
         self.board.index = 0
         self.view_board = self.board  # the board that is being viewed
-        self.boards = [self.board]  # all the boards in the game so far
+        # the history is a list of moves, plus a copy of the board every KEYFRAME_INTERVAL plies
+        # to rebuild past boards from
+        self.history = []
+        self.keyframes = {0: self.board.copy()}
+        self.view_cache = OrderedDict()
         self.turn = WHITE  # white starts first
         self.moves = 0  # move count
+        self.first_move = 1  # the number of the first move, as in the FEN the game started from
+        self.first_halfmove_clock = 0  # the halfmove clock of the starting position, for its FEN
         self.notation = []  # the chess notation of the game
+        # the times each position occurred since the last capture or pawn move, keyed by Board.position_key
+        self.positions = Counter({self.board.position_key(self.turn): 1})
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        # threefold repetition and the fifty-move rule end the game for the players, instead of being claimed
+        self.claim_draws = True
+        self.winner = None  # the color that won, None for a draw
+        self.draw_reason = None  # one of DRAW_REASONS once the game is drawn
         self.game_type = GAME_TYPES['UNDEFINED']  # before the game starts anything can be moved anywhere
         self.time_control = PRESET_TIME_CONTROLS['BLITZ']  # minutes + increments
+        self.schedule = schedule  # how the clock calls back when a player runs out of time
+        self.clock = GameClock(self.time_control, self.on_flag, self.schedule)
         self.index = self.view_board.index
         self.multiplayer = False
         self.started = False
+        # side effects (sounds, rendering, networking) subscribe to the game's events
+        self.events = EventBus()
 
     def start_game(self, game_type):
         self.game_type = game_type
-        self.board = Board()
+        self.board = self.board_type()
         self.board.index = 0
         self.view_board = self.board
         self.index = self.view_board.index
-        self.boards = [self.board]
+        self.history = []
+        self.keyframes = {0: self.board.copy()}
+        self.view_cache = OrderedDict()
         self.turn = WHITE
         self.moves = 0
+        self.first_move = 1
+        self.first_halfmove_clock = 0
+        self.notation = []
+        self.positions = Counter({self.board.position_key(self.turn): 1})
+        self.halfmove_clock = 0
+        self.winner = None
+        self.draw_reason = None
+        # the clocks start running once white has made the first move
+        self.clock = GameClock(self.time_control, self.on_flag, self.schedule)
         self.started = True
+        # online games are validated by the server, see server.py
+        self.multiplayer = game_type not in (GAME_TYPES['P/P (Local)'], GAME_TYPES['P/Bot (Local)'])
+        self.events.emit('START', game_type=game_type)
 
-        # TODO: handle multiplayer here
-        utils.play_sound('NOTIFY')
+    def load_board(self, board, halfmove_clock=0, fullmove=1):
+        """
+        start the game from another position
+        :param board: the starting position, with board.turn to move
+        :param halfmove_clock: int plies since the last capture or pawn move
+        :param fullmove: int number of the move being played
+        :return: None
+        """
+        self.board = board
+        self.board.index = 0
+        self.view_board = self.board
+        self.index = 0
+        self.history = []
+        self.keyframes = {0: self.board.copy()}
+        self.view_cache = OrderedDict()
+        self.turn = self.board.turn
+        self.moves = 0
+        self.notation = []
+        self.positions = Counter({self.board.position_key(self.turn): 1})
+        self.halfmove_clock = halfmove_clock
+        self.winner = None
+        self.draw_reason = None
+        self.first_halfmove_clock = halfmove_clock
+        self.first_move = fullmove
 
-    def end_game(self, winner):
-        print('Winner:', winner)
+    def end_game(self, winner, draw_reason=None):
+        """
+        :param winner: int color that won, None for a draw
+        :param draw_reason: str one of DRAW_REASONS, for a draw
+        :return: None
+        """
+        self.winner = winner
+        self.draw_reason = draw_reason
         self.started = False
         self.game_type = GAME_TYPES['UNDEFINED']
+        self.clock.stop()
+        self.events.emit('END', winner=winner)
 
-    def move(self, start_pos, dest_pos):
-        next_board = self.board.copy()
-        next_board.index = self.index + 1
-        piece1 = next_board.get_piece(start_pos[0], start_pos[1])
-        piece2 = next_board.get_piece(dest_pos[0], dest_pos[1])
+    def on_flag(self, color):
+        # the player whose time ran out loses
+        if self.started:
+            self.end_game(WHITE if color == BLACK else BLACK)
+
+    def move(self, start_pos, dest_pos, promotion='Q'):
+        # the move is timed when it is made, validating it is not charged to the player
+        moved_at = self.clock.timer()
         move_type = self.validate_move(start_pos, dest_pos)
-        if piece1 is None or move_type == MOVE_TYPES['ILLEGAL']:
+        if move_type == MOVE_TYPES['ILLEGAL']:
             return False  # move is not valid
-        if move_type == MOVE_TYPES['NORMAL']:
-            next_board.move(start_pos, dest_pos, piece2 is not None)
-            next_board.en_passant_pawn = None
-        if move_type == MOVE_TYPES['PAWN_JUMP']:
-            next_board.move(start_pos, dest_pos)
-            next_board.en_passant_pawn = piece1
-        if move_type == MOVE_TYPES['CASTLING']:
-            # get the castle squares and castle type
-            castle_type = 'Q' if dest_pos[0] == 2 else 'K'
-            castle_squares = King.get_castle_squares(piece1.color, castle_type)
-            # move the king to the last castle square
-            next_board.move(start_pos, castle_squares[-1])
-            time.sleep(.1)
-            # move the rook to the first castle square
-            rook_pos = [0 if castle_type == 'Q' else 7, 0 if piece1.color == WHITE else 7]
-            next_board.move(rook_pos, castle_squares[0])
-            next_board.en_passant_pawn = None
+        piece1 = self.board.get_piece(start_pos[0], start_pos[1])
+        if self.started and not self.clock.press(piece1.color, moved_at):
+            self.on_flag(piece1.color)
+            return False  # out of time
         if move_type == MOVE_TYPES['EN_PASSANT']:
-            next_board.move(start_pos, dest_pos, True)
-            next_board.en_passant_pawn.capture()
-        # update the board and view_board
-        self.board = next_board
+            captured = self.board.en_passant_pawn
+        else:
+            captured = self.board.get_piece(dest_pos[0], dest_pos[1])
+        captured_pos = None if captured is None else captured.pos
+        # the notation needs the board before the move, whose legal moves are already known
+        san = move_san(self.board, start_pos, dest_pos, move_type, promotion)
+        # play the move on the current board and record it
+        self.board.make_move(start_pos, dest_pos, move_type, promotion)
+        self.played(start_pos, dest_pos, move_type, promotion, piece1.color, captured, captured_pos, san)
+        return True  # move successful
+
+    def played(self, start_pos, dest_pos, move_type, promotion, color, captured=None, captured_pos=None, san=''):
+        """
+        record a move that was just made on the board and let the subscribers know
+        :param start_pos: list representing the starting location, None for a drop
+        :param dest_pos: list representing the ending location
+        :param move_type: int representing the move type
+        :param promotion: str representing the piece type promoted to or dropped
+        :param color: int color that made the move
+        :param captured: the piece that was captured, if any
+        :param captured_pos: where the captured piece stood
+        :param san: str notation of the move (see notation.move_san), without the check suffix
+        :return: None
+        """
+        self.history.append((None if start_pos is None else tuple(start_pos), tuple(dest_pos), move_type, promotion))
+        self.board.index = len(self.history)
+        if self.board.index % KEYFRAME_INTERVAL == 0:
+            self.keyframes[self.board.index] = self.board.copy()
+        # update the view_board
         self.view_board = self.board
         self.index = self.view_board.index
-        self.boards.append(self.board)
         # update turns
         prev = self.turn
         self.turn = WHITE if self.turn == BLACK else BLACK  # toggle who moves
-        if piece1.color == WHITE:
+        if color == WHITE:
             self.moves += 1
-        if self.board.is_checkmate(self.turn):
+        # no position before a capture or pawn move can occur again
+        material_changed = captured is not None or move_type == MOVE_TYPES['PROMOTION']
+        if material_changed or self.board.get_piece(dest_pos[0], dest_pos[1]).piece_type == '':
+            self.halfmove_clock = 0
+            self.positions.clear()
+        else:
+            self.halfmove_clock += 1
+        key = self.board.position_key(self.turn)
+        self.positions[key] += 1
+        # the check and mate the notation ends with are needed anyway to end the game
+        king = self.board.get_king(self.turn)
+        check = self.board.is_square_attacked(king.pos, prev)
+        checkmate = check and self.is_checkmate(self.turn)
+        san += '#' if checkmate else '+' if check else ''
+        self.notation.append(san)
+        # let the subscribers know what happened, they must not block the move
+        capture = captured is not None
+        self.events.emit('MOVE', start_pos=start_pos, dest_pos=dest_pos, move_type=move_type, capture=capture,
+                         san=san)
+        if capture:
+            self.events.emit('CAPTURE', pos=captured_pos, color=self.turn, piece=captured)
+        if move_type == MOVE_TYPES['CASTLING']:
+            rook_pos = [0 if dest_pos[0] == 2 else 7, dest_pos[1]]
+            self.events.emit('CASTLE', color=color, rook_pos=rook_pos,
+                             rook_dest=King.get_castle_squares(color, 'Q' if dest_pos[0] == 2 else 'K')[0])
+        if check:
+            self.events.emit('CHECK', color=self.turn)
+        if not self.started:
+            return  # moves played freely, outside of a game, have no result
+        if checkmate:
             self.end_game(prev)
-        return True  # move successful
+            return
+        draw_reason = self.drawn(key, material_changed)
+        if draw_reason is not None:
+            self.end_game(None, draw_reason)
+
+    def drawn(self, key, material_changed):
+        """
+        checks if the position after a move is a draw, without going through the history
+        :param key: the position key of the position, see Board.position_key
+        :param material_changed: bool, whether the move captured or promoted
+        :return: str one of DRAW_REASONS, or None if the game goes on
+        """
+        # the legal moves of the color to move are needed for its next move anyway
+        if self.is_stalemate(self.turn):
+            return 'STALEMATE'
+        # the pieces left only change with a capture or promotion
+        if material_changed and self.board.has_insufficient_material():
+            return 'INSUFFICIENT_MATERIAL'
+        if self.claim_draws:
+            if self.positions[key] >= REPETITION_LIMIT:
+                return 'REPETITION'
+            if self.halfmove_clock >= FIFTY_MOVE_PLIES:
+                return 'FIFTY_MOVES'
+        return None
+
+    def is_checkmate(self, color):
+        return self.board.is_checkmate(color)
+
+    def is_stalemate(self, color):
+        return self.board.is_stalemate(color)
 
     def validate_move(self, start_pos, dest_pos):
         move_type = MOVE_TYPES['NORMAL']
@@ -88,21 +232,42 @@ class Game:
         if piece1 is None or (self.game_type == GAME_TYPES['UNDEFINED'] and piece2 is not None):
             return MOVE_TYPES['ILLEGAL']
         if self.game_type != GAME_TYPES['UNDEFINED']:
-            for move in piece1.get_possible_moves():
-                if len(move) > 2:
-                    move_type = MOVE_TYPES[move[-1]]
-                # move is normal, handle it as such
-                if list(dest_pos) == move[0:2] and self.board.is_legal_move(start_pos, dest_pos, move_type):
-                    return move_type
-            return MOVE_TYPES['ILLEGAL']
+            # only the side to move can move, once a game is being played
+            if piece1.color != self.turn:
+                return MOVE_TYPES['ILLEGAL']
+            # look the move up in the legal moves of the position
+            piece_moves = self.board.legal_moves(piece1.color).get((start_pos[0], start_pos[1]), {})
+            return piece_moves.get((dest_pos[0], dest_pos[1]), MOVE_TYPES['ILLEGAL'])
         return move_type
 
+    def get_board(self, index):
+        """
+        get the board after a number of plies, rebuilding it from the closest keyframe
+        :param index: int number of plies played
+        :return: Board
+        """
+        if index == len(self.history):
+            return self.board
+        board = self.view_cache.get(index)
+        if board is not None:
+            self.view_cache.move_to_end(index)
+            return board
+        keyframe = index - index % KEYFRAME_INTERVAL
+        board = self.keyframes[keyframe].copy()
+        for start_pos, dest_pos, move_type, promotion in self.history[keyframe:index]:
+            board.make_move(start_pos, dest_pos, move_type, promotion)
+        board.index = index
+        self.view_cache[index] = board
+        if len(self.view_cache) > VIEW_CACHE_SIZE:
+            self.view_cache.popitem(last=False)
+        return board
+
     def next(self):
-        if self.index < len(self.boards) - 1:
+        if self.index < len(self.history):
             self.index += 1
-            self.view_board = self.boards[self.index]
+            self.view_board = self.get_board(self.index)
 
     def back(self):
         if self.index > 0:
             self.index -= 1
-            self.view_board = self.boards[self.index]
+            self.view_board = self.get_board(self.index)
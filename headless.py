@@ -0,0 +1,50 @@
+"""
+checks that the rules engine imports without kivy, within its import time budget
+
+usage: python headless.py [--budget SECONDS]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# the modules a server or batch job needs to validate games
+ENGINE_MODULES = ['constants', 'square', 'attacks', 'zobrist', 'cache', 'piece', 'board', 'bitboard', 'events', 'clock',
+                  'game', 'bughouse', 'encoding', 'notation', 'pgn', 'bot', 'book']
+IMPORT_TIME_BUDGET = 0.1  # seconds
+
+MEASURE_SCRIPT = f'''
+import json, sys, time
+start = time.perf_counter()
+for module in {ENGINE_MODULES!r}:
+    __import__(module)
+print(time.perf_counter() - start)
+print(json.dumps(sorted({{name.split('.')[0] for name in sys.modules}} & {{'kivy', 'speech_recognition'}})))
+'''
+
+
+def measure_import():
+    """
+    import the engine in a fresh interpreter, so nothing is already cached
+    :return: (seconds, list of ui packages that got imported)
+    """
+    output = subprocess.run([sys.executable, '-c', MEASURE_SCRIPT], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds, ui_packages = output.stdout.splitlines()
+    return float(seconds), json.loads(ui_packages)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='check the headless import of the rules engine')
+    parser.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET, help='seconds allowed for the import')
+    args = parser.parse_args(argv)
+    seconds, ui_packages = measure_import()
+    print(f'engine import: {seconds * 1000:.1f}ms (budget {args.budget * 1000:.0f}ms)')
+    if ui_packages:
+        print('the engine imported ui packages:', ', '.join(ui_packages))
+    return 1 if ui_packages or seconds > args.budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
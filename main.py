@@ -1,7 +1,10 @@
+import logging
+import os
 from kivy.app import App
-from kivy.core.image import Image
+from kivy.clock import Clock
+from kivy.factory import Factory
 from kivy.graphics import Color
-from kivy.graphics import Rectangle, Ellipse
+from kivy.graphics import Rectangle, Ellipse, InstructionGroup
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.popup import Popup
@@ -10,17 +13,29 @@ from kivy.uix.button import Button
 
 from constants import *
 from game import Game
-from constants import GAME_TYPES, MOVE_TYPES
+from constants import GAME_TYPES
 from theme import THEMES
+from bot import Bot
+from book import OpeningBook
+from client import ClientThread
 from commands import CommandListener
+from textures import PIECE_ATLAS
 import utils
 
+CASTLE_DELAY = .1  # seconds between the king and the rook moving when castling
+CLOCK_INTERVAL = .1  # seconds between updates of the clock label
+BOOK_PATH = 'assets/book.bin'  # the opening book of the bot, see book.py
+# the game types offered in the new game popup, bughouse needs both boards on the screen
+UI_GAME_TYPES = [GAME_TYPES['P/P (Local)'], GAME_TYPES['P/P (Online)'], GAME_TYPES['P/Bot (Local)']]
+
+log = logging.getLogger(__name__)
+
 
 class BoardWidget(Widget):
     def __init__(self, **kwargs):
         super(BoardWidget, self).__init__(**kwargs)
         self.app = App.get_running_app()
-        self.game = Game()
+        self.game = Game(schedule=Clock.schedule_once)  # run out of time on the ui thread
         self.selected_square = None
         self.selected_piece = None
         self.theme = self.app.theme
@@ -31,85 +46,245 @@ class BoardWidget(Widget):
         self.show_possible_moves = True
         self.margin = 0
         self.square_length = 0
+        self.layout = None  # the layout the canvas was built for
+        self.clock_event = None  # the scheduled update of the clock label
+        self.client = None  # the connection to the server in online games
+        self.online_game = None  # the id of the server session the online game is played in
+        self.color = None  # the color played in online games and against the bot
+        self.bot = None  # the computer opponent in games against the bot
+        # the book is mapped into memory, opening it doesn't read it
+        self.book = OpeningBook(BOOK_PATH) if os.path.exists(BOOK_PATH) else None
+        self.move_rows = []  # the white and black labels of each row of the move list
         self.command_listener = CommandListener()
+        self.game.events.subscribe('START', self.on_game_start)
+        self.game.events.subscribe('MOVE', self.on_game_move)
+        self.game.events.subscribe('CAPTURE', self.on_game_capture)
+        self.game.events.subscribe('CASTLE', self.on_game_castle)
+        self.game.events.subscribe('END', self.on_game_end)
         self.bind(size=self.render, pos=self.render)
 
+    @staticmethod
+    def play_sound(name, delay=0):
+        # sounds are played by the clock, so a move never waits on the audio
+        Clock.schedule_once(lambda dt: utils.play_sound(name), delay)
+
+    def on_game_start(self, game_type):
+        self.play_sound('NOTIFY')
+        self.app.move_list.clear_widgets()
+        self.move_rows = []
+        self.clock_event = Clock.schedule_interval(self.update_clock, CLOCK_INTERVAL)
+
+    def on_game_move(self, start_pos, dest_pos, move_type, capture, san):
+        if not capture:
+            self.play_sound('MOVE')
+        self.add_notation(san)
+
+    def add_notation(self, san):
+        # a white move starts a new row of the move list, a black move fills in the last one
+        color = WHITE if self.game.turn == BLACK else BLACK
+        if color == WHITE or not self.move_rows:
+            labels = [Factory.MoveLabel(text=f'{len(self.move_rows) + 1}.'),
+                      Factory.MoveLabel(text=san if color == WHITE else '...'),
+                      Factory.MoveLabel(text='')]
+            for label in labels:
+                self.app.move_list.add_widget(label)
+            self.move_rows.append(labels[1:])
+        if color == BLACK:
+            self.move_rows[-1][1].text = san
+
+    def on_game_capture(self, pos, color, piece):
+        self.play_sound('CAPTURE')
+
+    def on_game_castle(self, color, rook_pos, rook_dest):
+        # the king moves first, the rook follows a moment later with its own sound
+        Clock.schedule_once(lambda dt: self.place_piece(rook_dest, rook_pos))
+        Clock.schedule_once(lambda dt: self.place_piece(rook_dest, rook_dest), CASTLE_DELAY)
+        self.play_sound('MOVE', CASTLE_DELAY)
+
+    def on_game_end(self, winner):
+        self.play_sound('NOTIFY')
+        if self.clock_event is not None:
+            self.clock_event.cancel()
+            self.clock_event = None
+        self.update_clock()
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            self.online_game = None
+        if self.bot is not None:
+            self.bot.close()
+            self.bot = None
+        self.color = None
+        self.app.button.text = 'New Game'
+        self.app.button.background_color = self.app.theme.dark
+
+    def update_clock(self, *args):
+        # only touch the label when the shown time changes
+        clock = self.game.clock
+        text = f'{clock.format(clock.time_left(WHITE))} | {clock.format(clock.time_left(BLACK))}'
+        if self.app.clock_label.text != text:
+            self.app.clock_label.text = text
+
+    def place_piece(self, pos, draw_pos):
+        """
+        draw the piece on a square somewhere else, without changing the board
+        :param pos: [x, y] position of the piece on the board
+        :param draw_pos: [x, y] board position to draw it at
+        :return: None
+        """
+        index = pos[1] * RANK_COUNT + pos[0]
+        rect = self.piece_rects[index]
+        if rect is not None:
+            rect.pos = self.board_to_screen_pos(self.draw_pos(draw_pos[1] * RANK_COUNT + draw_pos[0]))
+            if draw_pos == pos:
+                self.displaced.discard(index)
+            else:
+                self.displaced.add(index)
+
     def render(self, *args):
+        # rebuild the canvas when the layout or theme changes, otherwise only update what changed
+        layout = (tuple(self.pos), tuple(self.size), self.draw_flipped, self.app.theme)
+        if layout != self.layout:
+            self.layout = layout
+            self.build()
+        self.render_squares()
+        self.render_possible_moves()
+        self.render_pieces()
+
+    def build(self):
+        """
+        create every canvas instruction once, to be updated in place by render
+        """
         self.theme = self.app.theme
         self.canvas.clear()
+        # resize everything
+        self.margin = self.width * .05
+        self.square_length = (self.width - self.margin * 2) / RANK_COUNT
+        size = (self.square_length, self.square_length)
         with self.canvas:
-            # resize everything
-            self.margin = self.width * .05
-            self.square_length = (self.width - self.margin * 2) / RANK_COUNT
-            self.render_squares()
-            self.render_pieces()
+            # draw the background
+            bg = self.theme.background
+            Color(bg[0], bg[1], bg[2], bg[3], mode='rgba')
+            self.background = Rectangle(pos=(self.pos[0], self.pos[1]), size=(self.width, self.height))
+            # one color and rectangle per square, in the order of square.SQUARES
+            self.square_colors = []
+            for i in range(RANK_COUNT * FILE_COUNT):
+                sqr_color = self.square_color(i)
+                self.square_colors.append(Color(sqr_color[0], sqr_color[1], sqr_color[2], sqr_color[3], mode='rgba'))
+                Rectangle(pos=self.board_to_screen_pos(self.draw_pos(i)), size=size)
+        self.colored_squares = {}  # square index to the color replacing its own
+        self.hover_square = None  # the square index under a dragged piece
+        self.hints = InstructionGroup()
+        self.canvas.add(self.hints)
+        self.hints_key = None
+        self.piece_group = InstructionGroup()
+        self.piece_group.add(Color(1, 1, 1, 1, mode='rgba'))
+        self.canvas.add(self.piece_group)
+        self.piece_rects = [None] * (RANK_COUNT * FILE_COUNT)  # the rectangle of the piece on each square
+        self.drawn_pieces = [None] * (RANK_COUNT * FILE_COUNT)  # the name of the piece drawn on each square
+        self.displaced = set()  # the squares whose piece is drawn somewhere else, while dragged or castling
+
+    def draw_pos(self, index):
+        # the position a square is drawn at, given its index in square.SQUARES
+        x, y = index % RANK_COUNT, index // RANK_COUNT
+        return [RANK_COUNT - (x + 1), FILE_COUNT - (y + 1)] if self.draw_flipped else [x, y]
+
+    def square_color(self, index):
+        x, y = index % RANK_COUNT, index // RANK_COUNT
+        return self.theme.dark if (x + y) % 2 == 0 else self.theme.light
 
     def render_pieces(self):
-        self.render_possible_moves()
-        # setup and draw all the pieces
+        # only touch the squares whose piece changed since the last render
+        names = [None] * (RANK_COUNT * FILE_COUNT)
         for piece in self.game.view_board.pieces:
-            draw_pos = [RANK_COUNT - (piece.pos[0] + 1),
-                        FILE_COUNT - (piece.pos[1] + 1)] if self.draw_flipped else piece.pos
-            piece_pos = self.board_to_screen_pos(draw_pos)
-            Color(1, 1, 1, 1, mode='rgba')
-            texture = Image(f'assets/pieces/{piece.name}.png').texture
-            piece.rect = Rectangle(texture=texture, pos=piece_pos, size=(self.square_length, self.square_length))
+            names[piece.pos[1] * RANK_COUNT + piece.pos[0]] = piece.name
+        for i in range(len(names)):
+            rect = self.piece_rects[i]
+            if names[i] != self.drawn_pieces[i]:
+                self.drawn_pieces[i] = names[i]
+                if names[i] is None:
+                    self.piece_group.remove(rect)
+                    self.piece_rects[i] = None
+                    continue
+                texture = PIECE_ATLAS.get(names[i], self.theme.pieces)
+                if rect is None:
+                    rect = Rectangle(texture=texture, size=(self.square_length, self.square_length))
+                    self.piece_group.add(rect)
+                    self.piece_rects[i] = rect
+                else:
+                    rect.texture = texture
+                rect.pos = self.board_to_screen_pos(self.draw_pos(i))
+        # put back the pieces that were drawn off their squares
+        for i in self.displaced:
+            if self.piece_rects[i] is not None:
+                self.piece_rects[i].pos = self.board_to_screen_pos(self.draw_pos(i))
+        self.displaced.clear()
 
     def render_squares(self):
-        # get the theme colors
-        light, dark, bg = self.theme.light, self.theme.dark, self.theme.background
-        # draw the background
-        Color(bg[0], bg[1], bg[2], bg[3], mode='rgba')
-        self.background = Rectangle(pos=(self.pos[0], self.pos[1]), size=(self.width, self.height))
-        # setup and draw all rectangles
-        for sqr in self.game.view_board.squares:
-            sqr_color = light if sqr.color == WHITE else dark
-            # highlight the selected square
-            if sqr == self.selected_square:
-                sqr_color = self.theme.highlight
-            Color(sqr_color[0], sqr_color[1], sqr_color[2], sqr_color[3], mode='rgba')
-            draw_pos = [RANK_COUNT - (sqr.pos[0] + 1), FILE_COUNT - (sqr.pos[1] + 1)] if self.draw_flipped else sqr.pos
-            sqr_pos = self.board_to_screen_pos(draw_pos)
-            sqr.rect = Rectangle(pos=sqr_pos, size=(self.square_length, self.square_length))
-        self.render_danger()
-
-    def render_danger(self):
+        colored = {}
+        # highlight the selected square
+        if self.selected_square is not None:
+            sqr_pos = self.selected_square.pos
+            colored[sqr_pos[1] * RANK_COUNT + sqr_pos[0]] = self.theme.highlight
+        self.render_danger(colored)
+        # recolor the squares that changed, and restore the ones that are no longer colored
+        changed = [i for i in set(self.colored_squares) | set(colored) if self.colored_squares.get(i) != colored.get(i)]
+        self.colored_squares = colored
+        for i in changed:
+            self.paint_square(i)
+
+    def paint_square(self, index):
+        # the hovered square is drawn over the highlight and danger colors
+        if index == self.hover_square:
+            sqr_color = self.theme.contrast
+        else:
+            sqr_color = self.colored_squares.get(index, self.square_color(index))
+        self.square_colors[index].rgba = (sqr_color[0], sqr_color[1], sqr_color[2], sqr_color[3])
+
+    def hover(self, index):
+        # move the hover highlight, repainting only the two squares involved
+        prev = self.hover_square
+        if index == prev:
+            return
+        self.hover_square = index
+        for i in [prev, index]:
+            if i is not None:
+                self.paint_square(i)
+
+    def render_danger(self, colored):
         if self.game.game_type == GAME_TYPES['UNDEFINED']:
             return
-        danger = self.theme.danger
         kings = [self.game.view_board.get_king(WHITE), self.game.view_board.get_king(BLACK)]
         for king in kings:
             # if the king in danger, change the square
-            if king.in_check():
-                sqr = self.game.view_board.get_square(king.pos[0], king.pos[1])
-                Color(danger[0], danger[1], danger[2], danger[3], mode='rgba')
-                draw_pos = [RANK_COUNT - (sqr.pos[0] + 1), FILE_COUNT - (sqr.pos[1] + 1)] if self.draw_flipped else sqr.pos
-                sqr_pos = self.board_to_screen_pos(draw_pos)
-                sqr.rect = Rectangle(pos=sqr_pos, size=(self.square_length, self.square_length))
+            opponent = WHITE if king.color == BLACK else BLACK
+            if self.game.view_board.is_square_attacked(king.pos, opponent):
+                colored[king.pos[1] * RANK_COUNT + king.pos[0]] = self.theme.danger
 
     def render_possible_moves(self):
+        # the hints only change with the selection or the position
+        key = (self.selected_square, self.game.index, len(self.game.history))
+        if key == self.hints_key:
+            return
+        self.hints_key = key
+        self.hints.clear()
         # render possible moves according to the settings
         if not self.show_possible_moves or self.selected_piece is None or \
                 self.game.game_type == GAME_TYPES['UNDEFINED']:
             return
-        # loop through the possible moves
-        for move in self.selected_piece.get_possible_moves():
-            # only render legal moves
-            if self.game.validate_move(self.selected_piece.pos, move[0:2]) == MOVE_TYPES['ILLEGAL']:
-                continue
+        c = self.theme.contrast
+        self.hints.add(Color(c[0], c[1], c[2], c[3], mode='rgba'))
+        # loop through the legal moves of the selected piece
+        legal_moves = self.game.board.legal_moves(self.selected_piece.color)
+        for move in legal_moves.get(self.selected_piece.pos, {}):
             # get the draw position of the square
-            sqr = self.game.board.get_square(move[0], move[1])
-            draw_pos = [RANK_COUNT - (sqr.pos[0] + 1), FILE_COUNT - (sqr.pos[1] + 1)] \
-                if self.draw_flipped else sqr.pos
-            sqr_pos = self.board_to_screen_pos(draw_pos)
+            sqr_pos = self.board_to_screen_pos(self.draw_pos(move[1] * RANK_COUNT + move[0]))
             # center the circle in the square
             circle_length = self.square_length / 3
             sqr_pos[0] = sqr_pos[0] + self.square_length / 2 - circle_length / 2
             sqr_pos[1] = sqr_pos[1] + self.square_length / 2 - circle_length / 2
-            c = self.theme.contrast
             # render a circle for all legal moves
-            Color(c[0], c[1], c[2], c[3], mode='rgba')
-            sqr.circle = Ellipse(pos=sqr_pos, size=[circle_length, circle_length])
+            self.hints.add(Ellipse(pos=sqr_pos, size=[circle_length, circle_length]))
 
     def flip(self):
         # toggle draw flipped variable
@@ -125,7 +300,7 @@ class BoardWidget(Widget):
             cancel_button = Button(text='Cancel')
             buttons = []
             for k, v in GAME_TYPES.items():
-                if v >= 0:
+                if v in UI_GAME_TYPES:
                     text = (k.replace('/', ' vs ').replace('+', ' + ')
                             .replace(' P', ' Player').replace('P ', 'Player '))
                     button = StartButton(board_widget=self, text=f'{v}. {text}')
@@ -138,44 +313,93 @@ class BoardWidget(Widget):
                 button.popup = self.popup
             self.popup.open()
         else:
-            winner = WHITE if self.game.turn == BLACK else BLACK
+            # the player of self.color resigns, in a hot-seat game it is the side to move
+            loser = self.game.turn if self.color is None else self.color
+            winner = WHITE if loser == BLACK else BLACK
+            if self.client is not None:
+                self.client.send({'type': 'resign', 'game': self.online_game})
             self.game.end_game(winner)
-            self.app.button.text = 'New Game'
-            self.app.button.background_color = self.app.theme.dark
 
     def start_game(self, game_type):
-        if game_type == 0:  # single-player chosen
+        if game_type in (GAME_TYPES['P/P (Local)'], GAME_TYPES['P/Bot (Local)']):  # single-player chosen
+            if game_type == GAME_TYPES['P/Bot (Local)']:
+                self.bot = Bot(BLACK, book=self.book)
+                self.color = WHITE
             self.game.start_game(game_type)
             self.render()
             self.app.button.text = 'Resign'
             self.app.button.background_color = self.app.theme.danger
-        else:  # multi-player, initiate server communication
-            pass
+        elif game_type == GAME_TYPES['P/P (Online)']:  # the server starts the game once both players joined
+            self.client = ClientThread(lambda message: Clock.schedule_once(lambda dt: self.on_server_message(message)))
+            self.client.start()
+            # without a game id the server pairs us with the next player looking for a game
+            self.client.send({'type': 'join'})
+            self.app.button.text = 'Waiting...'
+
+    def on_server_message(self, message):
+        # called on the ui thread with every message of the server
+        if message['type'] == 'joined':
+            self.online_game = message['game']
+            self.color = message['color']
+            if self.draw_flipped != (self.color == BLACK):
+                self.flip()
+        elif message['type'] == 'start':
+            self.game.start_game(message['game_type'])
+            self.render()
+            self.app.button.text = 'Resign'
+            self.app.button.background_color = self.app.theme.danger
+        elif message['type'] == 'move':
+            # our own moves are already on the board, only play the opponent's
+            if message['ply'] == len(self.game.history) + 1:
+                self.game.move(message['start'], message['dest'], message['promotion'])
+                self.render()
+        elif message['type'] == 'end':
+            if self.game.started:
+                self.game.end_game(message['winner'], message.get('reason'))
+                self.render()
+        elif message['type'] == 'error':
+            log.warning('server: %s', message['message'])
+        elif message['type'] == 'closed':
+            self.client = None
+            self.online_game = None
+            self.color = None
+            if not self.game.started:
+                self.app.button.text = 'New Game'  # the connection closed while waiting for the game
+
+    def on_bot_move(self, move, info):
+        # called on the ui thread with the move the bot found
+        if self.bot is None or move is None or self.game.turn != self.bot.color:
+            return
+        if 'depth' in info:
+            log.info('bot: depth %d, %d nodes/s', info['depth'], info['nps'])
+        self.game.move(*move)
+        self.render()
 
     def board_to_screen_pos(self, pos):
         x = self.square_length * pos[0] + self.margin + self.background.pos[0]
         y = self.square_length * pos[1] + self.margin + self.background.pos[1]
         return [x, y]
 
-    def get_square(self, pos):
-        # position is not valid
+    def screen_to_board_pos(self, pos):
+        """
+        map a screen position to the board position drawn under it, the inverse of board_to_screen_pos
+        :param pos: [x, y] screen position
+        :return: [x, y] board position, or None if pos is outside the widget
+        """
         if pos[0] < self.x or pos[0] > self.right or pos[1] < self.y or pos[1] > self.top:
             return None
+        # positions in the margin snap to the closest square on the edge
+        x = int((pos[0] - self.margin - self.background.pos[0]) // self.square_length)
+        y = int((pos[1] - self.margin - self.background.pos[1]) // self.square_length)
+        x = min(max(x, 0), RANK_COUNT - 1)
+        y = min(max(y, 0), FILE_COUNT - 1)
+        return [RANK_COUNT - (x + 1), FILE_COUNT - (y + 1)] if self.draw_flipped else [x, y]
 
-        # calculate distance from pos
-        def dist_from_pos(sqr):
-            draw_pos = [RANK_COUNT - (sqr.pos[0] + 1), FILE_COUNT - (sqr.pos[1] + 1)] if self.draw_flipped else sqr.pos
-            sqr_pos = self.board_to_screen_pos(draw_pos)
-            # measure the distance from the center of the square
-            sqr_pos[0] = sqr_pos[0] + self.square_length / 2
-            sqr_pos[1] = sqr_pos[1] + self.square_length / 2
-            return utils.dist(sqr_pos[0], sqr_pos[1], pos[0], pos[1])
-
-        # sort the squares by their distance to the mouse
-        self.game.view_board.squares.sort(key=lambda sqr: dist_from_pos(sqr))
-
-        # return the closest square
-        return self.game.view_board.squares[0]
+    def get_square(self, pos):
+        board_pos = self.screen_to_board_pos(pos)
+        if board_pos is None:
+            return None
+        return self.game.view_board.get_square(board_pos[0], board_pos[1])
 
     def on_touch_down(self, touch):
         # select a piece to move
@@ -187,7 +411,9 @@ class BoardWidget(Widget):
         if piece is not None:
             # can select any piece if game_type is undefined, otherwise can only
             # select a piece with the color of the person whose turn it is
-            if self.game.game_type == GAME_TYPES['UNDEFINED'] or self.game.turn == piece.color:
+            # (and only one's own pieces in online games)
+            if self.game.game_type == GAME_TYPES['UNDEFINED'] or \
+                    (self.game.turn == piece.color and self.color in (None, piece.color)):
                 self.game.view_board = self.game.board
                 self.selected_square = sqr
                 self.selected_piece = piece
@@ -198,7 +424,13 @@ class BoardWidget(Widget):
         if self.selected_piece is not None:
             x = touch.pos[0] - self.square_length / 2
             y = touch.pos[1] - self.square_length / 2
-            self.selected_piece.rect.pos = [x, y]
+            pos = self.selected_piece.pos
+            index = pos[1] * RANK_COUNT + pos[0]
+            self.piece_rects[index].pos = [x, y]
+            self.displaced.add(index)
+            # highlight the square the piece would be dropped on
+            board_pos = self.screen_to_board_pos(touch.pos)
+            self.hover(None if board_pos is None else board_pos[1] * RANK_COUNT + board_pos[0])
 
     def on_touch_up(self, touch):
         if self.selected_piece is not None:
@@ -208,7 +440,15 @@ class BoardWidget(Widget):
             hover_sqr = self.get_square(touch.pos)
             if hover_sqr is not None:
                 sqr = hover_sqr
-            result = self.game.move(self.selected_piece.pos, sqr.pos)
+            self.hover(None)
+            start_pos = self.selected_piece.pos
+            result = self.game.move(start_pos, sqr.pos)
+            if result and self.client is not None:
+                self.client.send({'type': 'move', 'game': self.online_game, 'start': start_pos, 'dest': sqr.pos})
+            if result and self.bot is not None:
+                # the bot thinks in its own process, its move comes back on the ui thread
+                self.bot.play(self.game, lambda move, info:
+                              Clock.schedule_once(lambda dt: self.on_bot_move(move, info)))
             self.selected_square = None
             self.selected_piece = None
             if self.auto_flip and result and self.game.game_type == GAME_TYPES['P/P (Local)']:
@@ -243,11 +483,15 @@ class BughouseBlitzApp(App):
     def __init__(self, **kwargs):
         super(BughouseBlitzApp, self).__init__(**kwargs)
         self.button = None
+        self.clock_label = None
+        self.move_list = None
         self.layout = None
 
     def build(self):
         self.layout = FloatLayout()
         self.button = self.layout.ids.button
+        self.clock_label = self.layout.ids.clock_label
+        self.move_list = self.layout.ids.move_list
         return self.layout
 
 
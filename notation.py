@@ -0,0 +1,122 @@
+"""
+standard algebraic notation (SAN): writing moves the way players read them, e.g. Nbd7, exd6, O-O, e8=Q+,
+and finding the legal move a SAN string stands for
+"""
+from constants import *
+from piece import PROMOTION_TYPES
+
+
+def square_name(pos):
+    return FILES[pos[0]] + str(RANKS[pos[1]])
+
+
+def parse_square(name):
+    """
+    :param name: str like 'e4'
+    :return: (x, y)
+    """
+    if len(name) != 2 or name[0] not in FILES or not '1' <= name[1] <= str(FILE_COUNT):
+        raise ValueError(f'not a square: {name}')
+    return FILES.index(name[0]), int(name[1]) - 1
+
+
+def move_san(board, start_pos, dest_pos, move_type, promotion='Q'):
+    """
+    the notation of a legal move, without the check suffix (see check_suffix)
+    :param board: the board before the move is made
+    :param start_pos: list representing the starting location, None for a drop
+    :param dest_pos: list representing the ending location
+    :param move_type: int representing the move type
+    :param promotion: str piece type promoted to or dropped
+    :return: str
+    """
+    if move_type == MOVE_TYPES['DROP']:
+        return (promotion or 'P') + '@' + square_name(dest_pos)
+    if move_type == MOVE_TYPES['CASTLING']:
+        return 'O-O-O' if dest_pos[0] == 2 else 'O-O'
+    piece = board.get_piece(start_pos[0], start_pos[1])
+    capture = move_type == MOVE_TYPES['EN_PASSANT'] or board.get_piece(dest_pos[0], dest_pos[1]) is not None
+    dest = (dest_pos[0], dest_pos[1])
+    if piece.piece_type == '':
+        san = (FILES[start_pos[0]] + 'x' if capture else '') + square_name(dest_pos)
+        if move_type == MOVE_TYPES['PROMOTION']:
+            san += '=' + promotion
+        return san
+    # name the starting file, rank or square when other pieces of the type can move to the same square
+    others = [pos for pos, piece_moves in board.legal_moves(piece.color).items()
+              if dest in piece_moves and pos != tuple(start_pos) and
+              board.get_piece(pos[0], pos[1]).piece_type == piece.piece_type]
+    disambiguation = ''
+    if others:
+        if all(pos[0] != start_pos[0] for pos in others):
+            disambiguation = FILES[start_pos[0]]
+        elif all(pos[1] != start_pos[1] for pos in others):
+            disambiguation = str(RANKS[start_pos[1]])
+        else:
+            disambiguation = square_name(start_pos)
+    return piece.piece_type + disambiguation + ('x' if capture else '') + square_name(dest_pos)
+
+
+def check_suffix(board):
+    """
+    :param board: the board after a move was made, with the opponent to move
+    :return: '#' for checkmate, '+' for check and '' otherwise
+    """
+    color = board.turn
+    king = board.get_king(color)
+    if king is None or not board.is_square_attacked(king.pos, WHITE if color == BLACK else BLACK):
+        return ''
+    return '#' if not board.legal_moves(color) else '+'
+
+
+def san(board, start_pos, dest_pos, move_type, promotion='Q'):
+    """
+    the full notation of a legal move, including check and checkmate
+    :param board: the board before the move, which is left unchanged
+    :return: str
+    """
+    notation = move_san(board, start_pos, dest_pos, move_type, promotion)
+    record = board.make_move(start_pos, dest_pos, move_type, promotion)
+    notation += check_suffix(board)
+    board.unmake_move(record)
+    return notation
+
+
+def parse_san(board, notation):
+    """
+    find the legal move of the color to move that a SAN string stands for
+    :param board: the board to play the move on
+    :param notation: str like 'Nbd7', 'exd6', 'O-O' or 'e8=Q+'
+    :return: (start_pos, dest_pos, move_type, promotion)
+    :raises ValueError: if the string is not a legal move, or is ambiguous
+    """
+    text = notation.rstrip('+#!?').replace('0', 'O')
+    color = board.turn
+    moves = board.legal_moves(color)
+    if text in ('O-O', 'O-O-O'):
+        king = board.get_king(color)
+        dest = (2 if text == 'O-O-O' else 6, king.pos[1])
+        if moves.get(king.pos, {}).get(dest) == MOVE_TYPES['CASTLING']:
+            return king.pos, dest, MOVE_TYPES['CASTLING'], 'Q'
+        raise ValueError(f'illegal move: {notation}')
+    promotion = 'Q'
+    if '=' in text:
+        text, promotion = text.split('=')
+    elif text and text[-1] in PROMOTION_TYPES and len(text) > 2 and text[-2].isdigit():
+        text, promotion = text[:-1], text[-1]  # e8Q
+    if promotion not in PROMOTION_TYPES:
+        raise ValueError(f'not a promotion piece: {notation}')
+    piece_type = text[0] if text and text[0] in 'KQRBN' else ''
+    dest = parse_square(text[-2:])
+    # whatever is left between the piece and the destination narrows down the starting square
+    hint = text[len(piece_type):-2].replace('x', '')
+    candidates = []
+    for start_pos, piece_moves in moves.items():
+        if dest not in piece_moves or board.get_piece(start_pos[0], start_pos[1]).piece_type != piece_type:
+            continue
+        if any(FILES[start_pos[0]] != c if c in FILES else str(RANKS[start_pos[1]]) != c for c in hint):
+            continue
+        candidates.append(start_pos)
+    if len(candidates) != 1:
+        raise ValueError(f'{"ambiguous" if candidates else "illegal"} move: {notation}')
+    return candidates[0], dest, moves[candidates[0]][dest], promotion
@@ -0,0 +1,142 @@
+"""
+perft: counts the leaf nodes of the legal move tree of a position, to check the
+move generator against known counts and to measure its speed
+
+usage: python perft.py [-d DEPTH] [-p POSITION ...] [--fen FEN] [--board BOARD] [--divide] [--json]
+"""
+import argparse
+import json
+import sys
+import time
+from bitboard import BOARD_TYPES
+from constants import *
+from piece import PROMOTION_TYPES
+
+# standard test positions and their known node counts at depth 1, 2, ...
+PERFT_POSITIONS = {
+    'start': ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+              [20, 400, 8902, 197281, 4865609]),
+    'kiwipete': ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                 [48, 2039, 97862, 4085603]),
+    'position3': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+                  [14, 191, 2812, 43238, 674624]),
+    'position4': ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+                  [6, 264, 9467, 422333]),
+    'position5': ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+                  [44, 1486, 62379, 2103487]),
+}
+
+
+def move_name(start_pos, dest_pos, promotion=''):
+    # a move in coordinate notation, e.g. e2e4 or e7e8q
+    return f'{FILES[start_pos[0]]}{RANKS[start_pos[1]]}{FILES[dest_pos[0]]}{RANKS[dest_pos[1]]}{promotion.lower()}'
+
+
+def expand(moves):
+    """
+    flatten a legal move dict into individual moves, one for each promotion piece
+    :param moves: dict mapping start position to a dict of destination position to move type
+    :return: list of (start_pos, dest_pos, move_type, promotion)
+    """
+    expanded = []
+    for start_pos, piece_moves in moves.items():
+        for dest_pos, move_type in piece_moves.items():
+            if move_type == MOVE_TYPES['PROMOTION']:
+                for promotion in PROMOTION_TYPES:
+                    expanded.append((start_pos, dest_pos, move_type, promotion))
+            else:
+                expanded.append((start_pos, dest_pos, move_type, ''))
+    return expanded
+
+
+def perft(board, depth):
+    """
+    count the positions reachable in exactly depth moves, without using any move caches
+    :param board: the position, with board.turn to move
+    :param depth: int number of half moves
+    :return: int
+    """
+    moves = expand(board.generate_legal_moves(board.turn))
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for start_pos, dest_pos, move_type, promotion in moves:
+        record = board.make_move(start_pos, dest_pos, move_type, promotion or 'Q')
+        nodes += perft(board, depth - 1)
+        board.unmake_move(record)
+    return nodes
+
+
+def divide(board, depth):
+    """
+    :return: dict mapping each legal move to the number of positions below it
+    """
+    counts = {}
+    for start_pos, dest_pos, move_type, promotion in expand(board.generate_legal_moves(board.turn)):
+        record = board.make_move(start_pos, dest_pos, move_type, promotion or 'Q')
+        counts[move_name(start_pos, dest_pos, promotion)] = perft(board, depth - 1)
+        board.unmake_move(record)
+    return counts
+
+
+def run(fen, depth, board_type='MAILBOX', split=False, expected=None):
+    """
+    time a perft run
+    :return: dict with the node count, timing and (optionally) the divide counts
+    """
+    board = BOARD_TYPES[board_type].from_fen(fen)
+    start = time.perf_counter()
+    if split:
+        counts = divide(board, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft(board, depth)
+    seconds = time.perf_counter() - start
+    result = {
+        'fen': fen, 'board': board_type, 'depth': depth, 'nodes': nodes,
+        'seconds': round(seconds, 6), 'nps': round(nodes / seconds) if seconds > 0 else 0
+    }
+    if expected is not None and depth <= len(expected):
+        result['expected'] = expected[depth - 1]
+        result['correct'] = nodes == expected[depth - 1]
+    if counts is not None:
+        result['divide'] = counts
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='count move generation nodes and measure their speed')
+    parser.add_argument('-d', '--depth', type=int, default=3)
+    parser.add_argument('-p', '--position', nargs='+', choices=list(PERFT_POSITIONS),
+                        help='standard positions to run (default: all of them)')
+    parser.add_argument('--fen', help='run a custom position instead of the standard ones')
+    parser.add_argument('--board', choices=list(BOARD_TYPES), default='MAILBOX')
+    parser.add_argument('--divide', action='store_true', help='show the node count below each move')
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        positions = {'custom': (args.fen, None)}
+    else:
+        positions = {name: PERFT_POSITIONS[name] for name in (args.position or PERFT_POSITIONS)}
+    results = {}
+    for name, (fen, expected) in positions.items():
+        results[name] = run(fen, args.depth, args.board, args.divide, expected)
+        if not args.json:
+            result = results[name]
+            for move, count in result.get('divide', {}).items():
+                print(f'  {move}: {count}')
+            check = ''
+            if 'correct' in result:
+                check = 'ok' if result['correct'] else f'WRONG (expected {result["expected"]})'
+            print(f'{name} depth {args.depth}: {result["nodes"]} nodes in {result["seconds"]:.3f}s '
+                  f'({result["nps"]} nodes/s) {check}')
+    if args.json:
+        print(json.dumps(results, indent=2))
+    # fail if any count is wrong, so regressions can be caught by scripts
+    return 1 if any(result.get('correct') is False for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
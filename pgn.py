@@ -0,0 +1,233 @@
+"""
+streaming reader and writer of portable game notation (PGN)
+
+the reader goes through a file line by line and yields one game at a time,
+so archives of any size can be read without loading them into memory
+
+usage: python pgn.py FILE [--check]
+"""
+import argparse
+import sys
+from bitboard import BOARD_TYPES
+from constants import *
+from game import Game
+from notation import move_san, parse_san, san
+
+RESULTS = ['1-0', '0-1', '1/2-1/2', '*']
+STANDARD_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+LINE_LENGTH = 80
+
+
+class PgnGame:
+    """
+    a game as read from a PGN file, its moves still in SAN
+    """
+    def __init__(self, headers, moves, result='*'):
+        self.headers = headers  # dict of tag name to value
+        self.moves = moves  # list of SAN strings
+        self.result = result
+
+    def board(self, board_type='MAILBOX'):
+        # the starting position of the game
+        return BOARD_TYPES[board_type].from_fen(self.headers.get('FEN', STANDARD_FEN))
+
+    def counters(self):
+        """
+        :return: (halfmove clock, fullmove number) of the starting position, from the last two fields of the FEN
+        :raises ValueError: if they are not numbers
+        """
+        fields = self.headers.get('FEN', STANDARD_FEN).split()
+        halfmove = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+        if halfmove < 0 or fullmove < 1:
+            raise ValueError(f'FEN move counters out of range: {halfmove} {fullmove}')
+        return halfmove, fullmove
+
+    def replay(self, board_type='MAILBOX'):
+        """
+        play the moves on a board, one at a time
+        :param board_type: str key of BOARD_TYPES
+        :return: generator of (board, (start_pos, dest_pos, move_type, promotion)),
+                 the same board is yielded every time, with the move already made
+        :raises ValueError: at the first move that is illegal in the position
+        """
+        board = self.board(board_type)
+        for notation in self.moves:
+            move = parse_san(board, notation)
+            board.make_move(*move)
+            yield board, move
+
+    def to_game(self):
+        """
+        :return: Game with the moves of the game in its history
+        """
+        game = Game()
+        game.claim_draws = False  # the moves are kept even if a draw could have been claimed
+        if 'FEN' in self.headers:
+            game.load_board(self.board(), *self.counters())
+        for notation in self.moves:
+            start_pos, dest_pos, move_type, promotion = parse_san(game.board, notation)
+            normalized = move_san(game.board, start_pos, dest_pos, move_type, promotion)
+            color = game.board.turn
+            if move_type == MOVE_TYPES['EN_PASSANT']:
+                captured = game.board.en_passant_pawn
+            else:
+                captured = game.board.get_piece(dest_pos[0], dest_pos[1])
+            captured_pos = None if captured is None else captured.pos
+            game.board.make_move(start_pos, dest_pos, move_type, promotion)
+            game.played(start_pos, dest_pos, move_type, promotion, color, captured, captured_pos, normalized)
+        return game
+
+
+def read_header(line, headers):
+    # [Name "value"], with \" and \\ escaped in the value
+    name, _, value = line.strip()[1:-1].partition(' ')
+    value = value.strip()
+    if value.startswith('"') and value.endswith('"'):
+        value = value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    headers[name] = value
+
+
+def read_pgn(lines):
+    """
+    read the games of a PGN file one by one
+    :param lines: an open file, or any other iterable of lines
+    :return: generator of PgnGame
+    """
+    headers = {}
+    moves = []
+    comment = False  # inside a {comment}, which can span lines
+    variation = 0  # how deep inside (variations) the reader is
+    for line in lines:
+        if not comment and variation == 0 and line.startswith('['):
+            if moves:
+                # a game without a result ended
+                yield PgnGame(headers, moves)
+                headers, moves = {}, []
+            read_header(line, headers)
+            continue
+        if line.startswith('%'):
+            continue  # escaped line
+        for token in tokens(line):
+            if comment:
+                if token == '}':
+                    comment = False
+            elif token == '{':
+                comment = True
+            elif token == ';':
+                break  # the rest of the line is a comment
+            elif token == '(':
+                variation += 1
+            elif token == ')':
+                variation = max(variation - 1, 0)
+            elif variation:
+                continue
+            elif token in RESULTS:
+                yield PgnGame(headers, moves, token)
+                headers, moves = {}, []
+            elif token[0] != '$' and (not token[0].isdigit() or token.startswith('0-0')):
+                # a token starting with a digit is a move number, unless it is castling written with zeros
+                moves.append(token)
+    if moves or headers:
+        yield PgnGame(headers, moves)
+
+
+def tokens(line):
+    """
+    split a line of movetext, keeping comment and variation delimiters as their own tokens
+    and dropping move numbers, e.g. '12.Nf3 {good} (12.e4)' gives 'Nf3', '{', 'good', '}', '(', 'e4', ')'
+    """
+    for char in '{};()':
+        line = line.replace(char, f' {char} ')
+    for token in line.split():
+        # 12.Nf3 and 12...Nf3 carry the move number in front of the move
+        if token[0].isdigit() and '.' in token:
+            token = token.rsplit('.', 1)[1]
+            if not token:
+                continue
+        if token != 'e.p.':
+            yield token
+
+
+def write_pgn(game, file, headers=None, result='*'):
+    """
+    write a game as PGN
+    :param game: Game, its notation is used when it has every move, otherwise the history is written out
+    :param file: an open text file
+    :param headers: dict of extra tags
+    :param result: str one of RESULTS
+    :return: None
+    """
+    tags = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?',
+            'Result': result}
+    tags.update(headers or {})
+    start = game.keyframes[0]
+    fen = start.to_fen(game.first_halfmove_clock, game.first_move)
+    if fen != STANDARD_FEN:
+        tags['SetUp'] = '1'
+        tags['FEN'] = fen
+    for name, value in tags.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        file.write(f'[{name} "{value}"]\n')
+    file.write('\n')
+    notation = game.notation
+    if len(notation) != len(game.history):
+        notation = history_san(game)
+    # move numbers go on from the one of the starting position
+    number = game.first_move
+    white = start.turn == WHITE
+    words = []
+    for i, move in enumerate(notation):
+        if white:
+            words.append(f'{number}. {move}')
+        elif i == 0:
+            words.append(f'{number}... {move}')
+        else:
+            words.append(move)
+        if not white:
+            number += 1
+        white = not white
+    words.append(result)
+    line = ''
+    for word in words:
+        if line and len(line) + len(word) + 1 > LINE_LENGTH:
+            file.write(line + '\n')
+            line = ''
+        line = f'{line} {word}' if line else word
+    file.write(line + '\n\n')
+
+
+def history_san(game):
+    """
+    :return: list of the SAN of every move in the game's history
+    """
+    board = game.keyframes[0].copy()
+    notation = []
+    for move in game.history:
+        notation.append(san(board, *move))
+        board.make_move(*move)
+    return notation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='read the games of a PGN file')
+    parser.add_argument('file')
+    parser.add_argument('--check', action='store_true', help='play every move to check that it is legal')
+    args = parser.parse_args(argv)
+    count = errors = 0
+    with open(args.file, encoding='utf-8', errors='replace') as file:
+        for pgn_game in read_pgn(file):
+            count += 1
+            if args.check:
+                try:
+                    for _ in pgn_game.replay():
+                        pass
+                except ValueError as error:
+                    errors += 1
+                    print(f'game {count}: {error}')
+    print(f'{count} games' + (f', {errors} invalid' if args.check else ''))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
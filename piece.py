@@ -1,5 +1,5 @@
 from constants import *
-from square import Square
+from square import SQUARES, Square
 
 MATERIAL_VALUES = {
     '': 1, 'R': 5,
@@ -9,18 +9,27 @@ MATERIAL_VALUES = {
 
 
 class Piece:
+    # a board holds many pieces, and a server many boards, so pieces have no __dict__
+    __slots__ = ('board', 'pos', 'color', 'piece_type', 'has_moved', 'captured', 'possible_moves', 'moves_version')
+
     def __init__(self, b, x, y, c, t):
         self.board = b
-        self.pos = (x, y)
+        self.pos = SQUARES[y * RANK_COUNT + x].pos  # the tuples of the shared squares are reused
         self.color = c
         self.piece_type = t
         self.has_moved = False  # for castling and pawn movement
         self.captured = False
-        self.name = ['b', 'w'][self.color] + t
-        self.rect = None
-        self.value = MATERIAL_VALUES[t]  # the material value of the piece
-        self.possible_moves = []
-        self.calculated_moves = False
+        self.possible_moves = None
+        self.moves_version = -1  # the board version the possible moves were calculated for
+
+    @property
+    def name(self):
+        return ['b', 'w'][self.color] + self.piece_type
+
+    @property
+    def value(self):
+        # the material value of the piece
+        return MATERIAL_VALUES[self.piece_type]
 
     def capture(self):
         self.captured = True
@@ -33,8 +42,6 @@ class Piece:
         piece = cls(board, self.pos[0], self.pos[1], self.color)
         piece.has_moved = self.has_moved
         piece.captured = self.captured
-        piece.value = self.value
-        piece.name = self.name
         return piece
 
     def __str__(self):
@@ -42,6 +49,8 @@ class Piece:
 
 
 class Pawn(Piece):
+    __slots__ = ()
+
     def __init__(self, b, x, y, c):
         super(Pawn, self).__init__(b, x, y, c, '')
 
@@ -51,20 +60,27 @@ class Pawn(Piece):
         direction = 1 if self.color == WHITE else -1
         possible_moves = []
         # only calculate possible moves once for performance purposes
-        if self.calculated_moves:
+        if self.moves_version == self.board.version:
             return self.possible_moves
+        # pawns reaching the last rank promote
+        last_rank = FILE_COUNT - 1 if self.color == WHITE else 0
         # moving vertically
         move1 = [self.pos[0], self.pos[1] + direction]
         move2 = [self.pos[0], self.pos[1] + direction * 2, 'PAWN_JUMP']
-        if self.board.is_valid_move(self.pos, move1) and self.board.get_square(move1[0], move1[1]).is_empty():
+        if self.board.is_valid_move(self.pos, move1) and self.board.get_piece(move1[0], move1[1]) is None:
+            if move1[1] == last_rank:
+                move1.append('PROMOTION')
             possible_moves.append(move1)
-        if self.board.is_valid_move(self.pos, move2) and self.board.get_square(move2[0], move2[
-            1]).is_empty() and not self.has_moved:
-            possible_moves.append(move2)
+            # can only jump if the square in between is empty too
+            if self.board.is_valid_move(self.pos, move2) and self.board.get_piece(move2[0], move2[1]) is None \
+                    and not self.has_moved:
+                possible_moves.append(move2)
         # capturing diagonally
         diagonal_moves = [[self.pos[0] - 1, self.pos[1] + direction], [self.pos[0] + 1, self.pos[1] + direction]]
         for move in diagonal_moves:
-            if self.board.is_valid_move(self.pos, move) and not self.board.get_square(move[0], move[1]).is_empty():
+            if self.board.is_valid_move(self.pos, move) and self.board.get_piece(move[0], move[1]) is not None:
+                if move[1] == last_rank:
+                    move.append('PROMOTION')
                 possible_moves.append(move)
         # en passant
         if self.board.en_passant_pawn is not None:
@@ -76,17 +92,20 @@ class Pawn(Piece):
                     move = [pawn_pos[0], pawn_pos[1] + direction, 'EN_PASSANT']
                     possible_moves.append(move)
         self.possible_moves = possible_moves
+        self.moves_version = self.board.version
         return possible_moves
 
 
 class Rook(Piece):
+    __slots__ = ()
+
     def __init__(self, b, x, y, c):
         super(Rook, self).__init__(b, x, y, c, 'R')
 
     def get_possible_moves(self):
         possible_moves = []
         # only calculate possible moves once for performance purposes
-        if self.calculated_moves:
+        if self.moves_version == self.board.version:
             return self.possible_moves
         # loop through the directions that the rook can move in
         for direction in [[-1, 0], [1, 0], [0, -1], [0, 1]]:
@@ -101,14 +120,17 @@ class Rook(Piece):
                 if not Square.is_valid(move[0], move[1]):
                     valid = False
                 # once a piece is in the way, that's the last piece that can be added (can't jump through pieces)
-                elif not self.board.get_square(move[0], move[1]).is_empty():
+                elif self.board.get_piece(move[0], move[1]) is not None:
                     valid = False
                 i += 1
         self.possible_moves = possible_moves
+        self.moves_version = self.board.version
         return possible_moves
 
 
 class Knight(Piece):
+    __slots__ = ()
+
     def __init__(self, b, x, y, c):
         super(Knight, self).__init__(b, x, y, c, 'N')
 
@@ -116,7 +138,7 @@ class Knight(Piece):
         if self.captured:
             return []
         # only calculate possible moves once for performance purposes
-        if self.calculated_moves:
+        if self.moves_version == self.board.version:
             return self.possible_moves
         possible_moves = [[self.pos[0] - 2, self.pos[1] + 1], [self.pos[0] - 2, self.pos[1] - 1],
                           [self.pos[0] + 2, self.pos[1] + 1], [self.pos[0] + 2, self.pos[1] - 1],
@@ -127,17 +149,20 @@ class Knight(Piece):
             if not self.board.is_valid_move(self.pos, move):
                 del possible_moves[i]
         self.possible_moves = possible_moves
+        self.moves_version = self.board.version
         return possible_moves
 
 
 class Bishop(Piece):
+    __slots__ = ()
+
     def __init__(self, b, x, y, c):
         super(Bishop, self).__init__(b, x, y, c, 'B')
 
     def get_possible_moves(self):
         possible_moves = []
         # only calculate possible moves once for performance purposes
-        if self.calculated_moves:
+        if self.moves_version == self.board.version:
             return self.possible_moves
         # loop through the directions that the rook can move in
         for direction in [[-1, -1], [-1, 1], [1, -1], [1, 1]]:
@@ -152,23 +177,24 @@ class Bishop(Piece):
                 else:
                     valid = False
                 # once a piece is in the way, that's the last piece that can be added (can't jump through pieces)
-                square = self.board.get_square(move[0], move[1])
-                piece = self.board.get_piece(move[0], move[1])
-                if square is None or not square.is_empty():
+                if not Square.is_valid(move[0], move[1]) or self.board.get_piece(move[0], move[1]) is not None:
                     valid = False
                 i += 1
         self.possible_moves = possible_moves
+        self.moves_version = self.board.version
         return possible_moves
 
 
 class Queen(Piece):
+    __slots__ = ()
+
     def __init__(self, b, x, y, c):
         super(Queen, self).__init__(b, x, y, c, 'Q')
 
     def get_possible_moves(self):
         possible_moves = []
         # only calculate possible moves once for performance purposes
-        if self.calculated_moves:
+        if self.moves_version == self.board.version:
             return self.possible_moves
         # loop through the directions that the rook can move in
         for direction in [[-1, 0], [1, 0], [0, -1], [0, 1], [-1, -1], [-1, 1], [1, -1], [1, 1]]:
@@ -183,24 +209,28 @@ class Queen(Piece):
                 if not Square.is_valid(move[0], move[1]):
                     valid = False
                 # once a piece is in the way, that's the last piece that can be added (can't jump through pieces)
-                elif not self.board.get_square(move[0], move[1]).is_empty():
+                elif self.board.get_piece(move[0], move[1]) is not None:
                     valid = False
                 i += 1
         self.possible_moves = possible_moves
+        self.moves_version = self.board.version
         return possible_moves
 
 
 class King(Piece):
+    __slots__ = ()
+
     def __init__(self, b, x, y, c):
         super(King, self).__init__(b, x, y, c, 'K')
-        king_side = King.get_castle_squares(self.color, 'K')
-        queen_side = King.get_castle_squares(self.color, 'Q')
-        self.castle_squares = {'K': king_side, 'Q': queen_side}
+
+    @property
+    def castle_squares(self):
+        return KING_CASTLE_SQUARES[self.color]
 
     def get_possible_moves(self):
         possible_moves = []
         # only calculate possible moves once for performance purposes
-        if self.calculated_moves:
+        if self.moves_version == self.board.version:
             return self.possible_moves
         # loop through the directions that the rook can move in
         for direction in [[-1, 0], [1, 0], [0, -1], [0, 1], [-1, -1], [-1, 1], [1, -1], [1, 1]]:
@@ -218,29 +248,29 @@ class King(Piece):
             move.append('CASTLING')
             possible_moves.append(move)
         self.possible_moves = possible_moves
+        self.moves_version = self.board.version
         return possible_moves
 
     def can_castle(self, side='K'):
         squares = self.castle_squares[side]
         empty = True
         for sqr in squares:
-            if not self.board.get_square(sqr[0], sqr[1]).is_empty():
+            if self.board.get_piece(sqr[0], sqr[1]) is not None:
                 empty = False
-        moved = self.has_moved
-        rooks = self.board.get_pieces_by_type('R')
-        for rook in rooks:
-            if rook.color == self.color and (rook.captured or rook.has_moved):
-                moved = True
+        rank = squares[0][1]
+        # the queen side rook also passes through the knight's square
+        if side == 'Q' and self.board.get_piece(1, rank) is not None:
+            empty = False
+        # neither the king nor the rook on this side can have moved
+        rook = self.board.get_piece(RANK_COUNT - 1 if side == 'K' else 0, rank)
+        moved = self.has_moved or self.pos != (4, rank) or rook is None or rook.piece_type != 'R' or \
+            rook.color != self.color or rook.has_moved
         return empty and not moved
 
     def in_check(self):
         # get the opponent's color
         opponent = WHITE if self.color == BLACK else BLACK
-        attackers = self.board.get_pieces_by_color(opponent)
-        for piece in attackers:
-            if list(self.pos) in piece.get_possible_moves():
-                return True
-        return False
+        return self.board.is_square_attacked(self.pos, opponent)
 
     @staticmethod
     def get_castle_squares(color, castle_type):
@@ -250,3 +280,10 @@ class King(Piece):
             'Q': [[start_pos[0] - 1, start_pos[1]], [start_pos[0] - 2, start_pos[1]]]
         }
         return castle_squares[castle_type]
+
+
+# the squares between the king and its castling square, for each color and side
+KING_CASTLE_SQUARES = {color: {side: King.get_castle_squares(color, side) for side in ['K', 'Q']}
+                       for color in [WHITE, BLACK]}
+PIECE_CLASSES = {'': Pawn, 'R': Rook, 'N': Knight, 'B': Bishop, 'Q': Queen, 'K': King}
+PROMOTION_TYPES = ['Q', 'R', 'B', 'N']  # the pieces a pawn can promote to
@@ -0,0 +1,296 @@
+"""
+multiplayer game server: hosts games and bughouse matches on one asyncio event loop,
+validates every move with the headless engine and sends the updates to the players
+and spectators of each game
+
+usage: python server.py [--host HOST] [--port PORT]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from bughouse import POCKET_TYPES, BughouseMatch
+from constants import *
+from encoding import encode_moves, encode_position
+from game import Game
+from piece import PROMOTION_TYPES
+
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+MAX_MESSAGE_SIZE = 4096  # bytes a message from a client may take
+MAX_BUFFER_SIZE = 1 << 20  # bytes waiting to be sent before a client that stopped reading is dropped
+SESSION_KINDS = {'GAME': GAME_TYPES['P/P (Online)'], 'BUGHOUSE': GAME_TYPES['P+P/P+P (Online)']}
+
+log = logging.getLogger(__name__)
+
+
+def encode(message):
+    # one message per line of json
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+def board_pos(value):
+    """
+    :param value: a position from a message
+    :return: [x, y]
+    :raises ValueError: unless value is two ints on the board
+    """
+    if not isinstance(value, list) or len(value) != 2 or any(type(i) is not int for i in value) or \
+            not (0 <= value[0] < RANK_COUNT and 0 <= value[1] < FILE_COUNT):
+        raise ValueError(f'not a square: {value}')
+    return value
+
+
+def schedule(callback, delay):
+    # the game clocks call back on the event loop, like Clock.schedule_once does in the ui
+    return asyncio.get_running_loop().call_later(delay, callback)
+
+
+class Connection:
+    """
+    a client of the server, the messages sent to it during one iteration
+    of the event loop are written together in a single write
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.outbox = []
+        self.seats = {}  # session id to (board, color) of the seats the client plays
+        self.followed = set()  # the ids of the sessions the client follows
+
+    def send(self, message):
+        if not self.outbox:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.outbox.append(encode(message))
+
+    def flush(self):
+        if self.writer.is_closing():
+            self.outbox = []
+            return
+        self.writer.write(b''.join(self.outbox))
+        self.outbox = []
+        # don't let a client that stopped reading use up the memory of the server
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER_SIZE:
+            self.writer.close()
+
+
+class Session:
+    """
+    a game or a bughouse match, together with the connections following it
+    """
+    def __init__(self, session_id, kind):
+        self.id = session_id
+        self.kind = kind
+        if kind == 'BUGHOUSE':
+            self.match = BughouseMatch(schedule=schedule)
+            self.games = self.match.games
+        else:
+            self.match = None
+            self.games = [Game(schedule=schedule)]
+        self.players = {}  # (board, color) to the connection playing it
+        self.watchers = set()  # every connection following the session, players included
+        for board, game in enumerate(self.games):
+            game.events.subscribe('MOVE', lambda board=board, **kwargs: self.on_move(board))
+            game.events.subscribe('END', lambda board=board, **kwargs: self.on_end(board, **kwargs))
+
+    def seats(self):
+        return [(board, color) for board in range(len(self.games)) for color in [WHITE, BLACK]]
+
+    def broadcast(self, message):
+        message['game'] = self.id
+        for connection in self.watchers:
+            connection.send(message)
+
+    def on_move(self, board):
+        start_pos, dest_pos, move_type, promotion = self.games[board].history[-1]
+        self.broadcast({'type': 'move', 'board': board, 'ply': len(self.games[board].history),
+                        'start': start_pos, 'dest': dest_pos, 'move_type': move_type, 'promotion': promotion})
+
+    def on_end(self, board, winner):
+        self.broadcast({'type': 'end', 'board': board, 'winner': winner, 'reason': self.games[board].draw_reason})
+
+    def state(self):
+        # the positions and moves are sent in the binary encoding of encoding.py, as hex
+        return {'type': 'state', 'game': self.id, 'kind': self.kind, 'started': self.games[0].started,
+                'positions': [encode_position(game.board).hex() for game in self.games],
+                'moves': [encode_moves(game.history).hex() for game in self.games]}
+
+
+class GameServer:
+    def __init__(self):
+        self.sessions = {}  # session id to Session
+        self.waiting = {}  # session kind to the id of the matched session still waiting for players
+        self.next_id = 0  # for the ids of matched sessions
+        self.server = None
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        """
+        start listening, port 0 picks any free port
+        :return: (host, port) the server is listening on
+        """
+        self.server = await asyncio.start_server(self.handle, host, port, limit=MAX_MESSAGE_SIZE)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        # read the messages of one client until it disconnects
+        connection = Connection(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break  # message too long or connection lost
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    connection.send({'type': 'error', 'message': 'invalid message'})
+                    continue
+                self.dispatch(connection, message)
+        finally:
+            self.disconnect(connection)
+            writer.close()
+
+    def dispatch(self, connection, message):
+        handler = {'join': self.join, 'move': self.move, 'drop': self.move, 'resign': self.resign}
+        if not isinstance(message, dict) or message.get('type') not in handler:
+            connection.send({'type': 'error', 'message': 'unknown message'})
+            return
+        try:
+            handler[message['type']](connection, message)
+        except (KeyError, TypeError, ValueError, IndexError):
+            connection.send({'type': 'error', 'message': f'malformed {message["type"]}'})
+        except Exception:
+            # a bug in the engine must not take down the connection, let alone the server
+            log.exception('error handling %s', message['type'])
+            connection.send({'type': 'error', 'message': f'could not handle {message["type"]}'})
+
+    def join(self, connection, message):
+        """
+        follow a session, creating it if needed, and take a seat unless spectating
+        once every seat is taken the game starts. players that join without a game id
+        are matched with each other in the order they join
+        """
+        kind = message.get('kind', 'GAME')
+        if message.get('game') is None:
+            if kind not in SESSION_KINDS:
+                raise ValueError(kind)
+            session_id = self.waiting.get(kind)
+            if session_id is None:
+                self.next_id += 1
+                session_id = f'{kind.lower()}-{self.next_id}'
+                self.waiting[kind] = session_id
+        else:
+            session_id = str(message['game'])
+        session = self.sessions.get(session_id)
+        if session is None:
+            if kind not in SESSION_KINDS:
+                raise ValueError(kind)
+            session = Session(session_id, kind)
+            self.sessions[session_id] = session
+        session.watchers.add(connection)
+        connection.followed.add(session_id)
+        connection.send(session.state())
+        if message.get('role') == 'spectator' or session_id in connection.seats:
+            return
+        free = [seat for seat in session.seats() if seat not in session.players]
+        if not free:
+            connection.send({'type': 'error', 'game': session_id, 'message': 'no free seat'})
+            return
+        seat = free[0]
+        session.players[seat] = connection
+        connection.seats[session_id] = seat
+        connection.send({'type': 'joined', 'game': session_id, 'board': seat[0], 'color': seat[1]})
+        if len(free) == 1:
+            if self.waiting.get(session.kind) == session_id:
+                del self.waiting[session.kind]
+            game_type = SESSION_KINDS[session.kind]
+            if session.match is not None:
+                session.match.start(game_type)
+            else:
+                session.games[0].start_game(game_type)
+            session.broadcast({'type': 'start', 'game_type': game_type})
+
+    def seated_game(self, connection, message):
+        # the session and game the connection plays in, if it is its turn there
+        session = self.sessions.get(str(message['game']))
+        seat = connection.seats.get(str(message['game']))
+        if session is None or seat is None:
+            connection.send({'type': 'error', 'message': 'not playing this game'})
+            return None, None
+        game = session.games[seat[0]]
+        if not game.started or game.turn != seat[1]:
+            connection.send({'type': 'error', 'game': session.id, 'message': 'not your turn'})
+            return None, None
+        return session, game
+
+    def move(self, connection, message):
+        session, game = self.seated_game(connection, message)
+        if game is None:
+            return
+        # the message is checked before it reaches the engine
+        dest = board_pos(message['dest'])
+        if message['type'] == 'drop':
+            piece_type = message['piece']
+            if piece_type not in POCKET_TYPES:
+                raise ValueError(piece_type)
+            made = session.match is not None and game.drop(piece_type, dest)
+        else:
+            promotion = message.get('promotion', 'Q')
+            if promotion not in PROMOTION_TYPES:
+                raise ValueError(promotion)
+            made = game.move(board_pos(message['start']), dest, promotion)
+        # the move is sent to everyone by the game's MOVE event
+        if not made:
+            connection.send({'type': 'error', 'game': session.id, 'message': 'illegal move'})
+
+    def resign(self, connection, message):
+        session = self.sessions.get(str(message['game']))
+        seat = connection.seats.get(str(message['game']))
+        if session is not None and seat is not None and session.games[seat[0]].started:
+            session.games[seat[0]].end_game(WHITE if seat[1] == BLACK else BLACK)
+
+    def disconnect(self, connection):
+        # forget the client, and the sessions nobody follows anymore
+        for session_id in connection.followed:
+            session = self.sessions[session_id]
+            session.watchers.discard(connection)
+            seat = connection.seats.get(session_id)
+            if seat is not None:
+                # the seat is free again, and a player who leaves a game in progress forfeits it
+                del session.players[seat]
+                game = session.games[seat[0]]
+                if game.started:
+                    game.end_game(WHITE if seat[1] == BLACK else BLACK)
+            if not session.watchers:
+                for game in session.games:
+                    game.clock.stop()
+                del self.sessions[session_id]
+                if self.waiting.get(session.kind) == session_id:
+                    del self.waiting[session.kind]
+
+
+async def serve(host, port):
+    server = GameServer()
+    host, port = await server.start(host, port)
+    print(f'serving on {host}:{port}')
+    await server.server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='host multiplayer games')
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -2,19 +2,22 @@ from constants import *
 
 
 class Square:
-    def __init__(self, b, x, y):
-        self.board = b
+    """
+    the fixed geometry of a square, the same for every board, see SQUARES
+    """
+    __slots__ = ('file', 'rank', 'pos', 'name', 'color')
+
+    def __init__(self, x, y):
         self.file = FILES[x]
         self.rank = RANKS[y]
         self.pos = (x, y)
         self.name = f"{self.file}{self.rank}"
         self.color = BLACK if (x + y) % 2 == 0 else WHITE
-        self.rect = None
-        self.circle = None
-
-    def is_empty(self):
-        return self.board.get_piece(self.pos[0], self.pos[1]) is None
 
     @staticmethod
     def is_valid(x, y):
         return -1 < x < len(FILES) and -1 < y < len(RANKS)
+
+
+# the squares shared by every board, indexed by y * RANK_COUNT + x
+SQUARES = [Square(x, y) for y in range(FILE_COUNT) for x in range(RANK_COUNT)]
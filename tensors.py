@@ -0,0 +1,223 @@
+"""
+positions as numpy arrays, for evaluating many positions at once and for training datasets
+
+positions are converted from their encoding (see encoding.py) a whole batch at a time, so the
+work per position is done by numpy and not by python loops. every position becomes PLANE_COUNT
+planes of 8x8 bytes, indexed [plane, y, x] with the first rank at y 0:
+    0-11  a plane per piece, in the order of BitBoard.bitboards (color * 6 + index in PIECE_TYPES)
+    12    all ones if white is to move
+    13-16 all ones for each of the castling rights, in the order of zobrist.CASTLE_RIGHTS
+    17    the pawn that can be taken en passant
+
+usage: python tensors.py FILE [FILE ...] --out DIR [--shard-size N]
+files ending in .pgn are read as PGN, any other file as game records of encoding.encode_game
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from bitboard import PIECE_TYPES
+from bot import SQUARE_VALUES
+from constants import *
+from encoding import (EN_PASSANT_BYTE, NO_SQUARE, PIECE_NIBBLES, POSITION_SIZE, STATE_BYTE, decode_game,
+                      encode_position, read_games)
+from notation import parse_san
+from pgn import read_pgn
+from zobrist import CASTLE_RIGHTS
+
+SQUARE_COUNT = RANK_COUNT * FILE_COUNT
+PIECE_PLANES = len(PIECE_TYPES) * 2
+TURN_PLANE = PIECE_PLANES
+CASTLING_PLANE = TURN_PLANE + 1
+EN_PASSANT_PLANE = CASTLING_PLANE + len(CASTLE_RIGHTS)
+PLANE_COUNT = EN_PASSANT_PLANE + 1
+SHARD_SIZE = 1 << 16  # positions per shard file
+BATCH_SIZE = 4096  # positions converted at a time
+# the nibble of the piece of each piece plane
+PLANE_NIBBLES = np.array([PIECE_NIBBLES[color, piece_type] for color in [BLACK, WHITE] for piece_type in PIECE_TYPES],
+                         dtype=np.uint8)
+# the value of every piece plane on every square, from white's side, see bot.SQUARE_VALUES
+PLANE_VALUES = np.array([[value if i // 6 == WHITE else -value for value in values]
+                         for i, values in enumerate(SQUARE_VALUES)], dtype=np.int32).reshape(-1)
+
+
+def position_planes(data):
+    """
+    :param data: encoded positions back to back, as bytes or a uint8 array
+    :return: uint8 array of shape (positions, PLANE_COUNT, FILE_COUNT, RANK_COUNT)
+    """
+    records = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray, memoryview)) \
+        else np.asarray(data, dtype=np.uint8)
+    records = records.reshape(-1, POSITION_SIZE)
+    count = len(records)
+    # two squares per byte, the lower nibble first
+    squares = np.empty((count, SQUARE_COUNT), dtype=np.uint8)
+    squares[:, 0::2] = records[:, :STATE_BYTE] & 0xF
+    squares[:, 1::2] = records[:, :STATE_BYTE] >> 4
+    planes = np.zeros((count, PLANE_COUNT, SQUARE_COUNT), dtype=np.uint8)
+    planes[:, :PIECE_PLANES] = squares[:, None, :] == PLANE_NIBBLES[None, :, None]
+    state = records[:, STATE_BYTE]
+    planes[:, TURN_PLANE] = (state & 1)[:, None]
+    for i in range(len(CASTLE_RIGHTS)):
+        planes[:, CASTLING_PLANE + i] = ((state >> (i + 1)) & 1)[:, None]
+    en_passant = records[:, EN_PASSANT_BYTE]
+    rows = np.nonzero(en_passant != NO_SQUARE)[0]
+    planes[rows, EN_PASSANT_PLANE, en_passant[rows]] = 1
+    return planes.reshape(count, PLANE_COUNT, FILE_COUNT, RANK_COUNT)
+
+
+def board_planes(boards):
+    """
+    :param boards: iterable of Board or BitBoard
+    :return: uint8 array of shape (positions, PLANE_COUNT, FILE_COUNT, RANK_COUNT)
+    """
+    return position_planes(b''.join(encode_position(board) for board in boards))
+
+
+def evaluate_planes(planes):
+    """
+    the material and piece-square score of every position, the same as bot.evaluate
+    :param planes: uint8 array of shape (positions, PLANE_COUNT, FILE_COUNT, RANK_COUNT)
+    :return: int32 array of the scores in centipawns, from the side of the color to move
+    """
+    pieces = planes[:, :PIECE_PLANES].reshape(len(planes), -1).astype(np.int32)
+    scores = pieces @ PLANE_VALUES
+    # the turn plane is all ones or all zeros, its first square says which
+    return np.where(planes[:, TURN_PLANE, 0, 0] == 1, scores, -scores)
+
+
+class ShardWriter:
+    """
+    writes planes to a series of memory-mapped .npy files of shard_size positions each,
+    so a dataset of any size is written without holding it in memory
+    """
+    def __init__(self, directory, prefix='positions', shard_size=SHARD_SIZE):
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shard = None  # the memory-mapped array being filled
+        self.filled = 0  # the positions written to the shard
+        self.paths = []  # the shard files, in order
+        self.count = 0  # the positions written
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open_shard(self):
+        path = os.path.join(self.directory, f'{self.prefix}-{len(self.paths):05}.npy')
+        self.paths.append(path)
+        self.filled = 0
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                         shape=(self.shard_size, PLANE_COUNT, FILE_COUNT, RANK_COUNT))
+
+    def write(self, planes):
+        """
+        :param planes: uint8 array of shape (positions, PLANE_COUNT, FILE_COUNT, RANK_COUNT)
+        :return: None
+        """
+        start = 0
+        while start < len(planes):
+            if self.shard is None:
+                self.shard = self.open_shard()
+            count = min(len(planes) - start, self.shard_size - self.filled)
+            self.shard[self.filled:self.filled + count] = planes[start:start + count]
+            self.filled += count
+            self.count += count
+            start += count
+            if self.filled == self.shard_size:
+                self.shard.flush()
+                self.shard = None
+
+    def close(self):
+        # the last shard is cut down to the positions it holds
+        if self.shard is None:
+            return
+        shard, self.shard = self.shard, None
+        path = self.paths[-1]
+        last = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.uint8,
+                                         shape=(self.filled, PLANE_COUNT, FILE_COUNT, RANK_COUNT))
+        last[:] = shard[:self.filled]
+        last.flush()
+        del shard, last
+        os.replace(path + '.tmp', path)
+
+
+def game_positions(paths):
+    """
+    every position of the games of the files, before each move and after the last one
+    games whose starting position can not be read are reported and skipped
+    :return: generator of bytes of encoded positions, one game at a time
+    """
+    for path in paths:
+        if path.lower().endswith('.pgn'):
+            with open(path, encoding='utf-8', errors='replace') as file:
+                for i, pgn_game in enumerate(read_pgn(file)):
+                    try:
+                        board = pgn_game.board()
+                    except ValueError as error:
+                        print(f'{path}: game {i + 1} skipped: {error}', file=sys.stderr)
+                        continue
+                    positions = [encode_position(board)]
+                    for notation in pgn_game.moves:
+                        try:
+                            board.make_move(*parse_san(board, notation))
+                        except ValueError:
+                            break  # the positions up to the illegal move are kept
+                        positions.append(encode_position(board))
+                    yield b''.join(positions)
+        else:
+            with open(path, 'rb') as file:
+                for i, record in enumerate(read_games(file)):
+                    try:
+                        board, moves = decode_game(record)
+                        positions = [encode_position(board)]
+                        for start_pos, dest_pos, move_type, promotion in moves:
+                            # a corrupt record must not be played onto the board
+                            if start_pos is None or \
+                                    board.legal_moves(board.turn).get(start_pos, {}).get(dest_pos) != move_type:
+                                break  # the positions up to the illegal move are kept
+                            board.make_move(start_pos, dest_pos, move_type, promotion)
+                            positions.append(encode_position(board))
+                    except ValueError as error:
+                        print(f'{path}: game {i + 1} skipped: {error}', file=sys.stderr)
+                        continue
+                    yield b''.join(positions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='write the positions of games as .npy shards of planes')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--out', required=True, help='the directory to write the shards to')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='positions per shard')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    converting = 0.0  # the seconds spent converting positions to planes, without reading the games
+    with ShardWriter(args.out, shard_size=args.shard_size) as writer:
+        batch = bytearray()
+        games = game_positions(args.files)
+        while True:
+            positions = next(games, None)
+            if positions is not None:
+                batch += positions
+                if len(batch) < BATCH_SIZE * POSITION_SIZE:
+                    continue
+            if batch:
+                converted_at = time.perf_counter()
+                writer.write(position_planes(batch))
+                converting += time.perf_counter() - converted_at
+                batch = bytearray()
+            if positions is None:
+                break
+    seconds = time.perf_counter() - start
+    print(f'{writer.count} positions in {len(writer.paths)} shards in {seconds:.2f}s '
+          f'({writer.count / max(converting, 1e-9):.0f} positions/s converted)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+from kivy.core.image import Image
+from constants import *
+
+# the columns of the piece sprite sheet, and its rows counted from the bottom
+PIECE_SHEET_COLUMNS = ['Q', 'K', 'R', 'N', 'B', '']
+PIECE_SHEET_ROWS = {WHITE: 0, BLACK: 1}
+
+
+class PieceAtlas:
+    """
+    piece textures cut out of a sprite sheet, decoded once and shared by every render
+    """
+    def __init__(self):
+        self.sheets = {}  # path to sheet texture
+        self.textures = {}  # (path, piece name) to texture region
+
+    def get(self, name, sheet):
+        """
+        :param name: str piece name, e.g. 'wK' or 'b' for a black pawn
+        :param sheet: str path of the sprite sheet
+        :return: the texture of the piece
+        """
+        texture = self.textures.get((sheet, name))
+        if texture is None:
+            sheet_texture = self.sheets.get(sheet)
+            if sheet_texture is None:
+                sheet_texture = Image(sheet).texture
+                self.sheets[sheet] = sheet_texture
+            width = sheet_texture.width / len(PIECE_SHEET_COLUMNS)
+            height = sheet_texture.height / len(PIECE_SHEET_ROWS)
+            color = WHITE if name[0] == 'w' else BLACK
+            column = PIECE_SHEET_COLUMNS.index(name[1:])
+            texture = sheet_texture.get_region(column * width, PIECE_SHEET_ROWS[color] * height, width, height)
+            self.textures[(sheet, name)] = texture
+        return texture
+
+
+PIECE_ATLAS = PieceAtlas()
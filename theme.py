@@ -10,6 +10,7 @@ class Theme:
         self.accent = utils.from_hex('eeeed2')
         self.danger = utils.from_preset('RED')
         self.contrast = utils.from_hex('145A32')
+        self.pieces = 'assets/pieces/pieces.png'  # the piece sprite sheet
 
     @staticmethod
     def create(light, dark, background, highlight, accent,
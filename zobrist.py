@@ -0,0 +1,25 @@
+import random
+from constants import *
+
+# fixed seed, so the same position has the same hash in every process
+ZOBRIST_SEED = 0xB7C4
+PIECE_KEY_TYPES = ['', 'N', 'B', 'R', 'Q', 'K']
+# castling rights in the order of their bits in Board.castling
+CASTLE_RIGHTS = [(WHITE, 'K'), (WHITE, 'Q'), (BLACK, 'K'), (BLACK, 'Q')]
+
+
+def zobrist_tables():
+    rng = random.Random(ZOBRIST_SEED)
+    pieces = {}
+    for color in [BLACK, WHITE]:
+        for piece_type in PIECE_KEY_TYPES:
+            pieces[color, piece_type] = [rng.getrandbits(64) for _ in range(RANK_COUNT * FILE_COUNT)]
+    turn = rng.getrandbits(64)
+    castling = [0] + [rng.getrandbits(64) for _ in range(2 ** len(CASTLE_RIGHTS) - 1)]
+    en_passant = [rng.getrandbits(64) for _ in range(RANK_COUNT)]
+    return pieces, turn, castling, en_passant
+
+
+# ZOBRIST_PIECES[color, piece_type][square], ZOBRIST_TURN is xored in when black is to move,
+# ZOBRIST_CASTLING[castling rights] and ZOBRIST_EN_PASSANT[file of the en passant pawn]
+ZOBRIST_PIECES, ZOBRIST_TURN, ZOBRIST_CASTLING, ZOBRIST_EN_PASSANT = zobrist_tables()